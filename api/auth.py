@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from db.database import SessionLocal
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
 from models.user import User
 from utils.auth import hash_password, verify_password, create_access_token
 from pydantic import BaseModel
@@ -8,13 +10,6 @@ from models.balance import Balance
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class RegisterForm(BaseModel):
     username: str
     email: str
@@ -25,17 +20,17 @@ class LoginForm(BaseModel):
     password: str
 
 @router.post("/register")
-def register_user(form: RegisterForm, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == form.email).first():
+async def register_user(form: RegisterForm, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User.id).where(User.email == form.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     new_user = User(
         username=form.username,
         email=form.email,
-        hashed_password=hash_password(form.password)
+        hashed_password=await run_in_threadpool(hash_password, form.password)   # bcrypt is slow
     )
     db.add(new_user)
-    db.flush()
+    await db.flush()
 
     new_balance = Balance(
         user_id = new_user.id,
@@ -43,14 +38,13 @@ def register_user(form: RegisterForm, db: Session = Depends(get_db)):
     )
     db.add(new_balance)
     
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"msg": "User registered successfully"}
 
 @router.post("/login")
-def login_user(form: LoginForm, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form.email).first()
-    if not user or not verify_password(form.password, user.hashed_password):
+async def login_user(form: LoginForm, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == form.email))
+    if not user or not await run_in_threadpool(verify_password, form.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = create_access_token(data={"sub": user.email})
+    token = create_access_token(data={"sub": user.email, "user_id": user.id})
     return {"access_token": token, "token_type": "bearer"}
@@ -0,0 +1,60 @@
+# api/candles.py
+from datetime import datetime
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
+from models.candle import Candle
+from services import market_data
+from services.candles import CANDLE_INTERVALS
+
+router = APIRouter(
+    prefix="/candles",
+    tags=["Candles"]
+)
+
+class CandleOut(BaseModel):
+    start: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+    trades: int
+
+@router.get("/{symbol}", response_model=List[CandleOut], summary="OHLCV bars, oldest first")
+async def get_candles(
+    symbol: str,
+    interval: str = "1m",
+    limit: int = Query(200, ge=1, le=1000),
+    before: datetime | None = Query(None, description="only bars that started earlier (paging)"),
+    include_open: bool = Query(True, description="append the engine's still-open bar"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if interval not in CANDLE_INTERVALS:
+        raise HTTPException(400, f"interval must be one of {', '.join(CANDLE_INTERVALS)}")
+    q = (select(Candle)
+         .where(Candle.stock_symbol == symbol.upper(), Candle.interval == interval)
+         .order_by(Candle.start.desc())
+         .limit(limit))
+    if before:
+        q = q.where(Candle.start < before)
+    bars = [CandleOut.model_validate(c, from_attributes=True)
+            for c in reversed((await db.scalars(q)).all())]
+
+    if include_open and before is None:
+        live = await run_in_threadpool(market_data.open_candle, symbol, interval)
+        if live:
+            live = CandleOut(**live)
+            last = bars[-1] if bars else None
+            if last and last.start == live.start:   # saved before an engine restart
+                bars[-1] = CandleOut(start=last.start, open=last.open,
+                                     high=max(last.high, live.high), low=min(last.low, live.low),
+                                     close=live.close, volume=last.volume + live.volume,
+                                     trades=last.trades + live.trades)
+            elif not last or live.start > last.start:
+                bars.append(live)
+    return bars[-limit:]
@@ -0,0 +1,26 @@
+# api/leaderboard.py
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from services.analytics import RANKINGS, leaderboard
+
+router = APIRouter(
+    prefix="/leaderboard",
+    tags=["Leaderboard"]
+)
+
+@router.get("", summary="Users ranked by P/L (recomputed every LEADERBOARD_REFRESH s)")
+async def get_leaderboard(
+    by: str = Query("pnl", description="pnl / realized_pnl / unrealized_pnl"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    if by not in RANKINGS:
+        raise HTTPException(400, f"by must be one of {', '.join(RANKINGS)}")
+    if not leaderboard.ready:                     # first request before the first refresh
+        await run_in_threadpool(leaderboard.refresh, True)
+    return {
+        "as_of":  leaderboard.as_of,
+        "trades": leaderboard.trades,
+        "users":  len(leaderboard.ranked[by]),
+        "ranked": leaderboard.top(by, limit, offset),
+    }
@@ -1,51 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db.database import SessionLocal
+import os, time
+from typing import Annotated, Literal, Union
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
 from models.order import Order, OrderType
-from models.user import User
-from pydantic import BaseModel
-from utils.auth import create_access_token
-from jose import JWTError, jwt
-from fastapi.security import OAuth2PasswordBearer
-import os
-from dotenv import load_dotenv
-from services.queue import publish_order
-
-load_dotenv()
+from pydantic import BaseModel, Field
+from utils.auth import AuthUser, get_current_user
+from services.queue import publish_order, publish_orders
+from services.metrics import Counter, STAGE_LATENCY
+
 router = APIRouter()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        if not email:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Token validation error")
+
+ORDER_BATCH_MAX = int(os.getenv("ORDER_BATCH_MAX", "1000"))   # operations per /batch call
+
+ORDERS_PLACED = Counter("api_orders_placed_total", "Orders accepted by /orders/place-order and /orders/batch")
+BATCH_OPS     = Counter("api_order_batch_ops_total", "Operations in /orders/batch calls", ["op", "result"])
 
 class OrderForm(BaseModel):
     stock_symbol: str
-    quantity: int
-    price: float
+    quantity: int = Field(gt=0)
+    price: float = Field(gt=0)
     order_type: OrderType
 
 @router.post("/place-order")
-def place_order(form: OrderForm, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def place_order(form: OrderForm, db: AsyncSession = Depends(get_async_db), current_user: AuthUser = Depends(get_current_user)):
+    started = time.perf_counter()
     order = Order(
         user_id=current_user.id,
         stock_symbol=form.stock_symbol,
@@ -54,8 +35,7 @@ def place_order(form: OrderForm, db: Session = Depends(get_db), current_user: Us
         order_type=form.order_type
     )
     db.add(order)
-    db.commit()
-    db.refresh(order)
+    await db.commit()
     order_data = {
         "order_id": order.id,
         "user_id": current_user.id,
@@ -64,5 +44,95 @@ def place_order(form: OrderForm, db: Session = Depends(get_db), current_user: Us
         "price": order.price,
         "order_type": order.order_type
     }
-    publish_order(order_data)
+    await run_in_threadpool(publish_order, order_data)      # pika is blocking
+    ORDERS_PLACED.inc()
+    STAGE_LATENCY.observe(time.perf_counter() - started, stage="api")
     return {"msg": "Order placed", "order_id": order.id}
+
+# ---- batch: new / amend / cancel in one call ---------------------------
+class NewOp(BaseModel):
+    op: Literal["new"]
+    stock_symbol: str
+    quantity: int = Field(gt=0)
+    price: float = Field(gt=0)
+    order_type: OrderType
+
+class AmendOp(BaseModel):
+    op: Literal["amend"]
+    order_id: int
+    price:    float | None = Field(None, gt=0)
+    quantity: int   | None = Field(None, gt=0)
+
+class CancelOp(BaseModel):
+    op: Literal["cancel"]
+    order_id: int
+
+BatchOp = Annotated[Union[NewOp, AmendOp, CancelOp], Field(discriminator="op")]
+
+class BatchForm(BaseModel):
+    ops: list[BatchOp] = Field(min_length=1, max_length=ORDER_BATCH_MAX)
+
+@router.post("/batch")
+async def place_batch(form: BatchForm, db: AsyncSession = Depends(get_async_db), current_user: AuthUser = Depends(get_current_user)):
+    """
+    Up to ORDER_BATCH_MAX operations, validated together: all new orders
+    go in with one multi-row INSERT … RETURNING id, amends / cancels are
+    checked against the user's orders with one SELECT, and the accepted
+    messages are published as one batch per engine queue.  A malformed
+    body is rejected whole (422); an operation that can't apply (unknown
+    order, nothing to amend) is reported in its result and skipped.
+    New orders, amends and cancels travel on separate queues, so don't
+    rely on their relative order inside one batch.
+    """
+    started = time.perf_counter()
+    uid     = current_user.id
+    results: list[dict] = [{"index": i, "op": op.op} for i, op in enumerate(form.ops)]
+
+    # ----- amends / cancels: one ownership lookup --------------------------
+    ids = {op.order_id for op in form.ops if op.op != "new"}
+    symbols = dict((await db.execute(
+        select(Order.id, Order.stock_symbol)
+          .where(Order.id.in_(ids), Order.user_id == uid)
+    )).all()) if ids else {}
+
+    messages, new_ops = [], []
+    for res, op in zip(results, form.ops):
+        if op.op == "new":
+            new_ops.append((res, op))
+            continue
+        res["order_id"] = op.order_id
+        if op.order_id not in symbols:
+            res.update(status="rejected", error="Order not found")
+        elif op.op == "amend" and op.price is None and op.quantity is None:
+            res.update(status="rejected", error="Nothing to amend")
+        else:
+            msg = {"kind": op.op, "order_id": op.order_id, "user_id": uid,
+                   "stock_symbol": symbols[op.order_id].upper()}
+            if op.op == "amend":
+                msg["fields"] = op.model_dump(include={"price", "quantity"}, exclude_none=True)
+            messages.append(msg)
+            res["status"] = "accepted"
+
+    # ----- new orders: one INSERT … RETURNING id ---------------------------
+    if new_ops:
+        rows = [{"user_id": uid, "stock_symbol": op.stock_symbol, "quantity": op.quantity,
+                 "price": op.price, "order_type": op.order_type} for _, op in new_ops]
+        order_ids = (await db.scalars(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True), rows
+        )).all()
+        await db.commit()
+        for (res, op), oid, row in zip(new_ops, order_ids, rows):
+            res.update(status="accepted", order_id=oid)
+            messages.append({"order_id": oid, **row})
+
+    if messages:
+        await run_in_threadpool(publish_orders, messages)   # pika is blocking
+
+    accepted = 0
+    for res in results:
+        ok = res["status"] == "accepted"
+        accepted += ok
+        BATCH_OPS.inc(op=res["op"], result=res["status"])
+    ORDERS_PLACED.inc(len(new_ops))
+    STAGE_LATENCY.observe(time.perf_counter() - started, stage="api")
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
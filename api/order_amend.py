@@ -1,9 +1,13 @@
 # api/order_amend.py
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
-import json, pika
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from utils.auth import get_current_user
-from db.database import SessionLocal
+from db.database import AsyncSessionLocal
+from models.order import Order
+from services.queue import publisher
+from services.sharding import queue_for
 
 router = APIRouter(
     prefix="/orders",
@@ -19,20 +23,23 @@ class CancelPayload(BaseModel):
     confirm: bool = True
 
 # ---- Rabbit helper -----------------------------------------------------
-def publish(queue: str, message: dict):
-    conn = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
-    ch   = conn.channel()
-    ch.queue_declare(queue=queue)
-    ch.basic_publish(
-        exchange="",
-        routing_key=queue,
-        body=json.dumps(message).encode()
-    )
-    conn.close()
+async def publish(queue: str, message: dict):
+    # routed to the engine shard that owns the symbol; pika blocks
+    await run_in_threadpool(
+        publisher.publish, queue_for(queue, message["stock_symbol"]), message)
+
+async def _order_symbol(order_id: int, user_id: int) -> str:
+    async with AsyncSessionLocal() as db:
+        symbol = await db.scalar(
+            select(Order.stock_symbol)
+            .where(Order.id == order_id, Order.user_id == user_id))
+    if not symbol:
+        raise HTTPException(404, "Order not found")
+    return symbol.upper()
 
 # ---- PATCH (amend) -----------------------------------------------------
 @router.patch("/{order_id}", summary="Amend an open order")
-def amend_order(
+async def amend_order(
     order_id: int,
     body: AmendPayload,
     user = Depends(get_current_user)
@@ -40,17 +47,18 @@ def amend_order(
     if body.price is None and body.quantity is None:
         raise HTTPException(400, "Nothing to amend")
 
-    publish("order_amend_queue", {
+    await publish("order_amend_queue", {
         "kind":      "amend",
         "order_id":  order_id,
         "user_id":   user.id,
+        "stock_symbol": await _order_symbol(order_id, user.id),
         "fields":    body.dict(exclude_none=True)
     })
     return {"msg": "amend sent"}
 
 # ---- DELETE (cancel) ---------------------------------------------------
 @router.delete("/{order_id}", summary="Cancel an open order")
-def cancel_order(
+async def cancel_order(
     order_id: int,
     body: CancelPayload,
     user = Depends(get_current_user)
@@ -58,9 +66,10 @@ def cancel_order(
     if not body.confirm:
         raise HTTPException(400, "Cancel not confirmed")
 
-    publish("order_cancel_queue", {
+    await publish("order_cancel_queue", {
         "kind":     "cancel",
         "order_id": order_id,
-        "user_id":  user.id
+        "user_id":  user.id,
+        "stock_symbol": await _order_symbol(order_id, user.id)
     })
     return {"msg": "cancel sent"}
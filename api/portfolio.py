@@ -1,22 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db.database import SessionLocal
-from models.user import User
-from utils.auth import get_current_user          # you already had this helper
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
+from utils.auth import AuthUser, get_current_user          # you already had this helper
 from services.portfolio import get_user_positions
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/")
-def my_portfolio(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def my_portfolio(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthUser = Depends(get_current_user)
 ):
-    return get_user_positions(current_user.id, db)
+    return await get_user_positions(current_user.id, db)
@@ -1,14 +1,23 @@
 # api/trades.py
-from typing import List
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from db.database import SessionLocal
+import base64, csv, io, json
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select, tuple_, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from db.database import AsyncSessionLocal, get_async_db
 from models.trade import Trade
+from services import market_data
+from utils.auth import AuthUser, get_current_user
 from pydantic import BaseModel
 from datetime import datetime
 
 router = APIRouter()
 
+EXPORT_CHUNK = 1000                  # rows per fetch from the server-side cursor
+
 # ---------- Pydantic response ----------
 class TradeOut(BaseModel):
     id: int
@@ -22,18 +31,116 @@ class TradeOut(BaseModel):
     class Config:
         orm_mode = True
 
-# ---------- DB helper ----------
-def get_db():
-    db = SessionLocal()
+# ---------- keyset cursor ----------
+# Pages are newest first, ordered by (timestamp, id).  The cursor is the
+# last row's key; the next page is everything strictly older, which the
+# (…, timestamp, id) indexes serve directly however deep the page is.
+def _encode_cursor(t: Trade) -> str:
+    return base64.urlsafe_b64encode(f"{t.timestamp.isoformat()}|{t.id}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
     try:
-        yield db
-    finally:
-        db.close()
+        ts, tid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(tid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _page(symbol: str | None, cursor: str | None, limit: int, where=()):
+    newest = (Trade.timestamp.desc(), Trade.id.desc())
+    q = select(Trade).where(*where)
+    if symbol:
+        q = q.where(Trade.stock_symbol == symbol.upper())
+    if cursor:
+        q = q.where(tuple_(Trade.timestamp, Trade.id) < _decode_cursor(cursor))
+    return q.order_by(*newest).limit(limit)
+
+async def _send_page(q, limit: int, response: Response, db: AsyncSession):
+    rows = (await db.scalars(q)).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+    return rows
 
 # ---------- Routes ----------
 @router.get("/", response_model=List[TradeOut])
-def list_trades(limit: int = 50, symbol: str | None = None, db: Session = Depends(get_db)):
-    q = db.query(Trade).order_by(Trade.timestamp.desc())
+async def list_trades(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    symbol: str | None = None,
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await _send_page(_page(symbol, cursor, limit), limit, response, db)
+
+@router.get("/mine", response_model=List[TradeOut])
+async def my_trades(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    symbol: str | None = None,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthUser = Depends(get_current_user),
+):
+    """Trades the caller bought or sold in, newest first (same paging as /trades/)."""
+    # one index range scan per leg instead of an OR filter + sort
+    legs = union(*(_page(symbol, cursor, limit, [col == current_user.id])
+                   for col in (Trade.buyer_id, Trade.seller_id))).subquery()
+    t = aliased(Trade, legs)
+    q = select(t).order_by(t.timestamp.desc(), t.id.desc()).limit(limit)
+    return await _send_page(q, limit, response, db)
+
+async def _export(fmt: str, symbol: str | None, user_id: int | None):
+    """Yield NDJSON / CSV chunks straight off a server-side cursor, oldest first."""
+    q = select(Trade.id, Trade.buyer_id, Trade.seller_id, Trade.stock_symbol,
+               Trade.price, Trade.quantity, Trade.timestamp)
     if symbol:
-        q = q.filter(Trade.stock_symbol == symbol.upper())
-    return q.limit(limit).all()
+        q = q.where(Trade.stock_symbol == symbol.upper())
+    if user_id is not None:
+        q = q.where(or_(Trade.buyer_id == user_id, Trade.seller_id == user_id))
+    q = q.order_by(Trade.timestamp, Trade.id).execution_options(yield_per=EXPORT_CHUNK)
+
+    cols = list(TradeOut.model_fields)
+    if fmt == "csv":
+        yield ",".join(cols) + "\r\n"
+    # own session: the request's dependency is closed before the body streams
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(q)
+        async for rows in result.partitions():
+            buf = io.StringIO()
+            if fmt == "csv":
+                csv.writer(buf).writerows(
+                    (*r[:-1], r.timestamp.isoformat() if r.timestamp else "") for r in rows)
+            else:
+                for r in rows:
+                    buf.write(json.dumps(dict(zip(cols, r)), default=datetime.isoformat) + "\n")
+            yield buf.getvalue()
+
+def _export_response(fmt: str, symbol: str | None, user_id: int | None = None):
+    media = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    name  = f"trades.{'csv' if fmt == 'csv' else 'ndjson'}"
+    return StreamingResponse(_export(fmt, symbol, user_id), media_type=media,
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+@router.get("/export")
+async def export_trades(format: Literal["ndjson", "csv"] = "ndjson", symbol: str | None = None):
+    """Whole trade history (optionally one symbol), streamed."""
+    return _export_response(format, symbol)
+
+@router.get("/mine/export")
+async def export_my_trades(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    symbol: str | None = None,
+    current_user: AuthUser = Depends(get_current_user),
+):
+    return _export_response(format, symbol, current_user.id)
+
+@router.get("/ticker")
+async def all_tickers():
+    """Last / bid / ask / day stats per symbol, from the engine (cached)."""
+    return await run_in_threadpool(market_data.tickers)      # may hit the engine
+
+@router.get("/ticker/{symbol}")
+async def one_ticker(symbol: str):
+    t = await run_in_threadpool(market_data.ticker, symbol)
+    if t is None:
+        raise HTTPException(status_code=404, detail="No ticker for symbol")
+    return t
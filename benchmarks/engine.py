@@ -0,0 +1,164 @@
+# benchmarks/engine.py
+# In-process matching-engine benchmark – no RabbitMQ, no Postgres.
+#
+#   python -m benchmarks.engine                         # every flow, 50k orders
+#   python -m benchmarks.engine -f deep_sweep -n 200000 --sink memory
+#   python -m benchmarks.engine -o after.json --compare before.json
+#
+# Each flow (benchmarks/flows.py) is generated up front, then fed through
+# consumer.dispatch one message at a time, exactly as the consume loop
+# does, with fills going to a null or in-memory trade sink and no
+# journal.  Engine logging is held at WARNING while timing, so the log
+# listener thread has nothing to write.
+# --risk turns the pre-trade cash checks on, every user starting rich.
+# Reported per flow: orders/sec, per-message latency percentiles and the
+# resting orders left.  Memory per resting order is measured separately
+# with tracemalloc on a book of non-crossing orders.
+import argparse, contextlib, gc, json, logging, platform, subprocess, time, tracemalloc
+from datetime import datetime, UTC
+
+import numpy as np
+
+from benchmarks.flows import FLOWS, Flow
+from matching_engine import consumer, replay
+from matching_engine.order_book import order_index
+from matching_engine.risk import Account, Ledger
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def reset(sink: str, risk: bool = False):
+    """Fresh engine state (see replay.reset), optionally with cash checks."""
+    replay.reset(sink)
+    if risk:
+        consumer.ledger = Ledger("cash", loader=lambda uid: Account(1e12))
+
+@contextlib.contextmanager
+def quiet():
+    """Only WARNING and up from the engine's loggers (services/log.py) meanwhile."""
+    root  = logging.getLogger("stocksim")
+    level = root.level
+    root.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        root.setLevel(level)
+
+def run_flow(name: str, n: int, seed: int, sink: str, risk: bool = False) -> dict:
+    msgs = FLOWS[name](n, seed)
+    reset(sink, risk)
+    dispatch = consumer.dispatch
+    lat = np.empty(len(msgs), dtype=np.int64)
+    clock = time.perf_counter_ns
+
+    gc.collect()
+    with quiet():
+        start = clock()
+        for i, msg in enumerate(msgs):
+            t = clock()
+            dispatch(msg)
+            lat[i] = clock() - t
+        total = clock() - start
+
+    return {
+        "messages":        len(msgs),
+        "seconds":         round(total / 1e9, 4),
+        "orders_per_sec":  round(len(msgs) / (total / 1e9)),
+        "latency_us": {
+            **{f"p{p:g}": round(float(np.percentile(lat, p)) / 1e3, 2) for p in PERCENTILES},
+            "mean": round(float(lat.mean()) / 1e3, 2),
+            "max":  round(float(lat.max()) / 1e3, 2),
+        },
+        "fills":           consumer.trade_sink.count,
+        "resting":         len(order_index),
+    }
+
+def memory_per_order(n: int, seed: int) -> dict:
+    """
+    tracemalloc bytes per resting order on a book that never crosses.
+    The messages are built under tracing too, so anything the book
+    keeps of them (e.g. the symbol string) is counted.
+    """
+    reset("null")
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    f = Flow(seed)
+    msgs = [f.passive("AAPL", spread=1, width=500) for _ in range(n)]
+    with quiet():
+        for msg in msgs:
+            consumer.dispatch(msg)
+    del msgs, f                                   # only what the book holds stays
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    resting = len(order_index)
+    return {"resting": resting, "bytes_per_order": round((after - before) / resting, 1)}
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(now: dict, before: dict):
+    print(f"\n{'flow':<14}{'orders/s':>12}{'Δ':>8}{'p99 µs':>10}{'Δ':>8}")
+    for name, r in now["flows"].items():
+        old = before.get("flows", {}).get(name)
+        if not old:
+            continue
+        d_ops = r["orders_per_sec"] / old["orders_per_sec"] - 1
+        d_p99 = r["latency_us"]["p99"] / old["latency_us"]["p99"] - 1
+        print(f"{name:<14}{r['orders_per_sec']:>12,}{d_ops:>+8.1%}"
+              f"{r['latency_us']['p99']:>10}{d_p99:>+8.1%}")
+    if "memory" in now and "memory" in before:
+        print(f"bytes/resting order: {now['memory']['bytes_per_order']} "
+              f"(was {before['memory']['bytes_per_order']})")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="StockSim matching-engine benchmark")
+    ap.add_argument("-f", "--flow", action="append", choices=sorted(FLOWS),
+                    help="flow to run (repeatable; default: all)")
+    ap.add_argument("-n", "--orders", type=int, default=50_000, help="messages per flow")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--sink", choices=("null", "memory"), default="null")
+    ap.add_argument("--risk", action="store_true", help="run with the pre-trade cash checks")
+    ap.add_argument("--memory-orders", type=int, default=100_000,
+                    help="resting orders for the memory measurement (0 = skip)")
+    ap.add_argument("-o", "--out", help="write results as JSON here")
+    ap.add_argument("--compare", help="earlier JSON results to diff against")
+    args = ap.parse_args(argv)
+
+    results = {
+        "meta": {
+            "when":    datetime.now(UTC).isoformat(timespec="seconds"),
+            "git":     _git_rev(),
+            "python":  platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "orders":  args.orders, "seed": args.seed, "sink": args.sink, "risk": args.risk,
+        },
+        "flows": {},
+    }
+    for name in args.flow or list(FLOWS):
+        r = results["flows"][name] = run_flow(name, args.orders, args.seed, args.sink, args.risk)
+        lat = r["latency_us"]
+        print(f"[BENCH] {name:<13} {r['orders_per_sec']:>9,} msg/s   "
+              f"p50 {lat['p50']:>7} µs  p99 {lat['p99']:>7} µs  p99.9 {lat['p99.9']:>8} µs   "
+              f"fills {r['fills']:>7,}  resting {r['resting']:>7,}")
+    if args.memory_orders:
+        m = results["memory"] = memory_per_order(args.memory_orders, args.seed)
+        print(f"[BENCH] memory        {m['bytes_per_order']} bytes per resting order "
+              f"({m['resting']:,} resting)")
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+        print(f"[BENCH] results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(results, json.load(fh))
+    return results
+
+if __name__ == "__main__":
+    main()
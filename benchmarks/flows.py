@@ -0,0 +1,117 @@
+# benchmarks/flows.py
+# Seeded synthetic order flow for the engine benchmarks.
+#
+# Each generator returns a list of engine messages (what the consumer
+# reads off RabbitMQ) so building the flow is not part of the timing.
+# The same (name, n, seed) always gives the same flow.
+import random
+from typing import Callable, Dict, List
+
+MID = 100.0
+TICK = 0.01
+
+
+class Flow:
+    """Id / user bookkeeping shared by the generators."""
+
+    def __init__(self, seed: int, users: int = 100):
+        self.rnd     = random.Random(seed)
+        self.users   = users
+        self.next_id = 1
+        self.live: List[tuple[int, int, str]] = []    # (order_id, user_id, symbol) maybe resting
+
+    def px(self, offset_ticks: int) -> float:
+        return round(MID + offset_ticks * TICK, 2)
+
+    def new(self, symbol: str, side: str, price: float, qty: int) -> dict:
+        oid, uid = self.next_id, self.rnd.randrange(1, self.users + 1)
+        self.next_id += 1
+        self.live.append((oid, uid, symbol))
+        return {"kind": "new", "order_id": oid, "user_id": uid, "stock_symbol": symbol,
+                "order_type": side, "price": price, "quantity": qty}
+
+    def _pick(self) -> tuple[int, int, str]:
+        i = self.rnd.randrange(len(self.live))
+        self.live[i], self.live[-1] = self.live[-1], self.live[i]
+        return self.live.pop()
+
+    def cancel(self) -> dict:
+        oid, uid, sym = self._pick()
+        return {"kind": "cancel", "order_id": oid, "user_id": uid, "stock_symbol": sym}
+
+    def amend(self) -> dict:
+        oid, uid, sym = self._pick()
+        self.live.append((oid, uid, sym))
+        return {"kind": "amend", "order_id": oid, "user_id": uid, "stock_symbol": sym,
+                "fields": {"quantity": self.rnd.randint(1, 50)}}
+
+    def passive(self, symbol: str, spread: int = 1, width: int = 50) -> dict:
+        """Rests on its side of the mid (never crosses)."""
+        side = self.rnd.choice(("buy", "sell"))
+        off  = self.rnd.randint(spread, spread + width)
+        return self.new(symbol, side, self.px(-off if side == "buy" else off),
+                        self.rnd.randint(1, 100))
+
+
+def uniform(n: int, seed: int) -> List[dict]:
+    """One symbol, limit orders priced uniformly ±50 ticks round the mid – lots cross."""
+    f, out = Flow(seed), []
+    for _ in range(n):
+        out.append(f.new("AAPL", f.rnd.choice(("buy", "sell")),
+                         f.px(f.rnd.randint(-50, 50)), f.rnd.randint(1, 100)))
+    return out
+
+def market_maker(n: int, seed: int) -> List[dict]:
+    """Quoting-heavy: mostly passive quotes, re-sizes and pulls, ~5% takers."""
+    f, out = Flow(seed), []
+    for _ in range(n):
+        r = f.rnd.random()
+        if r < 0.55 or len(f.live) < 100:
+            out.append(f.passive("AAPL", spread=1, width=10))
+        elif r < 0.75:
+            out.append(f.cancel())
+        elif r < 0.95:
+            out.append(f.amend())
+        else:
+            side = f.rnd.choice(("buy", "sell"))
+            out.append(f.new("AAPL", side, f.px(15 if side == "buy" else -15),
+                             f.rnd.randint(50, 300)))
+    return out
+
+def cancel_storm(n: int, seed: int) -> List[dict]:
+    """Build a deep book with half the flow, then cancel nearly all of it."""
+    f, out = Flow(seed), []
+    build = n // 2
+    for _ in range(build):
+        out.append(f.passive("AAPL", spread=1, width=500))
+    while len(out) < n and f.live:
+        out.append(f.cancel())
+    return out
+
+def deep_sweep(n: int, seed: int) -> List[dict]:
+    """Many small resting orders over many levels, then big orders sweeping them."""
+    f, out = Flow(seed), []
+    while len(out) < n:
+        for _ in range(min(200, n - len(out) - 1)):
+            out.append(f.new("AAPL", "sell", f.px(f.rnd.randint(1, 200)), f.rnd.randint(1, 10)))
+        if len(out) < n:
+            out.append(f.new("AAPL", "buy", f.px(200), 200 * 5))
+    return out
+
+def many_symbols(n: int, seed: int, symbols: int = 1000) -> List[dict]:
+    """Uniform flow spread over `symbols` tickers."""
+    f, out = Flow(seed), []
+    names = [f"S{i:04d}" for i in range(symbols)]
+    for _ in range(n):
+        out.append(f.new(f.rnd.choice(names), f.rnd.choice(("buy", "sell")),
+                         f.px(f.rnd.randint(-20, 20)), f.rnd.randint(1, 100)))
+    return out
+
+
+FLOWS: Dict[str, Callable[[int, int], List[dict]]] = {
+    "uniform":      uniform,
+    "market_maker": market_maker,
+    "cancel_storm": cancel_storm,
+    "deep_sweep":   deep_sweep,
+    "many_symbols": many_symbols,
+}
@@ -9,12 +9,35 @@ print("PORT:", os.getenv("DB_PORT"))
 print("NAME:", os.getenv("DB_NAME"))
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 
-DB_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+DB_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME')}"
+ASYNC_DB_URL = DB_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 
-engine = create_engine(DB_URL)
+# connection pool, per engine and per process
+POOL = dict(
+    pool_size     = int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow  = int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    pool_timeout  = float(os.getenv("DB_POOL_TIMEOUT", "30")),     # s waiting for a conn
+    pool_recycle  = int(os.getenv("DB_POOL_RECYCLE", "1800")),     # s before reconnect
+    pool_pre_ping = True,
+)
+
+# sync: matching engine, trade writer, CLI tools, create_all
+engine = create_engine(DB_URL, **POOL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# async (asyncpg): the FastAPI routers
+async_engine = create_async_engine(ASYNC_DB_URL, **POOL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+async def get_async_db():
+    """FastAPI dependency: one AsyncSession per request."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,6 +1,7 @@
 # main.py
-from fastapi import FastAPI
-from db.database import Base, engine
+import time
+from fastapi import FastAPI, Request, Response
+from db.database import Base, engine, async_engine
 from fastapi.middleware.cors import CORSMiddleware
 from api.auth import router as auth_router
 from api.order import router as order_router
@@ -10,9 +11,18 @@ from models.trade import Trade
 from api.trades import router as trades_router
 from api.portfolio import router as portfolio_router
 from models.balance import Balance
+from models.position import Position
+from models.candle import Candle
 from api.balance import router as balance_router
+from api.candles import router as candles_router
+from api.leaderboard import router as leaderboard_router
+from services.queue import publisher
+from services.analytics import leaderboard
+from services import metrics
 
 Base.metadata.create_all(bind=engine)
+for ix in Trade.__table__.indexes:            # create_all skips existing tables
+    ix.create(bind=engine, checkfirst=True)
 
 app = FastAPI()
 
@@ -25,6 +35,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_LATENCY = metrics.Histogram("http_request_seconds", "API request latency", ["method", "route"])
+HTTP_COUNT   = metrics.Counter("http_requests_total", "API requests", ["method", "route", "status"])
+
+@app.middleware("http")
+async def _observe(request: Request, call_next):
+    started  = time.perf_counter()
+    response = await call_next(request)
+    route    = request.scope.get("route")
+    path     = route.path if route else "unmatched"     # template, not the raw URL
+    HTTP_LATENCY.observe(time.perf_counter() - started, method=request.method, route=path)
+    HTTP_COUNT.inc(method=request.method, route=path, status=response.status_code)
+    return response
+
 app.include_router(auth_router, prefix="/auth")
 
 app.include_router(order_router, prefix="/orders")
@@ -35,6 +58,24 @@ app.include_router(portfolio_router, prefix="/portfolio")
 
 app.include_router(balance_router)
 
+app.include_router(candles_router)
+
+app.include_router(leaderboard_router)
+
+@app.on_event("startup")
+async def _start_leaderboard():
+    leaderboard.start()
+
+@app.on_event("shutdown")
+async def _close_pools():
+    leaderboard.close()
+    publisher.close()
+    await async_engine.dispose()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 def root():
     return {"message": "StockSim backend is running!"}
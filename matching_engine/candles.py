@@ -0,0 +1,141 @@
+# matching_engine/candles.py
+# Rolling OHLCV bars per symbol for every CANDLE_INTERVALS entry.
+#
+# on_fill() is called by the engine thread for every fill (under
+# book_lock) and touches one bar per interval – O(1) per fill.  A bar
+# closes when a fill lands in a later bucket or when the writer thread
+# sweeps it after its interval has passed; closed bars are written in
+# bulk every CANDLE_FLUSH_INTERVAL seconds (services/candles.py).
+# Replayed fills are skipped, like trades: their original times are gone.
+import threading, time
+from datetime import datetime
+from typing import Dict
+
+from db.database import SessionLocal
+from matching_engine.order_book import book_lock
+from services.candles import CANDLE_INTERVALS, CANDLE_FLUSH_INTERVAL, save_candles
+from services.log import get_logger
+
+log = get_logger("candles")
+
+
+class Bar:
+    __slots__ = ("start", "open", "high", "low", "close", "volume", "trades")
+
+    def __init__(self, start: int, price: float):
+        self.start  = start                       # epoch seconds, bucket aligned
+        self.open   = self.high = self.low = self.close = price
+        self.volume = 0
+        self.trades = 0
+
+    def add(self, price: float, qty: int):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close   = price
+        self.volume += qty
+        self.trades += 1
+
+    def as_dict(self) -> dict:
+        return {"start":  datetime.utcfromtimestamp(self.start).isoformat(),
+                "open":   self.open, "high": self.high, "low": self.low,
+                "close":  self.close, "volume": self.volume, "trades": self.trades}
+
+
+# (symbol, interval) → open bar;  closed bars waiting for the writer
+_open:   Dict[tuple[str, str], Bar] = {}
+_closed: list[tuple[str, str, Bar]] = []
+_intervals = list(CANDLE_INTERVALS.items())
+
+def on_fill(symbol: str, price: float, qty: int, ts: float | None = None):
+    ts = time.time() if ts is None else ts
+    for name, seconds in _intervals:
+        start = int(ts // seconds) * seconds
+        bar   = _open.get((symbol, name))
+        if bar is None or bar.start != start:
+            if bar is not None:
+                _closed.append((symbol, name, bar))
+            bar = _open[symbol, name] = Bar(start, price)
+        bar.add(price, qty)
+
+def take_closed(now: float | None = None) -> list[tuple[str, str, Bar]]:
+    """
+    Closed bars, plus open ones whose interval has ended by `now`.
+    Engine-thread state: call under book_lock.
+    """
+    global _closed
+    now = time.time() if now is None else now
+    for (sym, name), bar in list(_open.items()):
+        if bar.start + CANDLE_INTERVALS[name] <= now:
+            _closed.append((sym, name, _open.pop((sym, name))))
+    closed, _closed = _closed, []
+    return closed
+
+def reset():
+    """Drop every open and closed bar unsaved (fresh books: replays, benchmarks)."""
+    _open.clear()
+    _closed.clear()
+
+def _rows(closed: list[tuple[str, str, Bar]]) -> list[dict]:
+    return [{"stock_symbol": sym, "interval": name,
+             "start": datetime.utcfromtimestamp(b.start),
+             "open": b.open, "high": b.high, "low": b.low, "close": b.close,
+             "volume": b.volume, "trades": b.trades}
+            for sym, name, b in closed]
+
+def current(symbol: str, interval: str) -> dict | None:
+    """The still-open bar, if the symbol traded in this interval."""
+    bar = _open.get((symbol.upper(), interval))
+    if bar is None or bar.start + CANDLE_INTERVALS.get(interval, 0) <= time.time():
+        return None
+    return bar.as_dict()
+
+
+class CandleWriter:
+    """Background thread: sweep closed bars every flush interval and save them."""
+
+    def __init__(self, flush_interval: float = CANDLE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._stop   = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="candle-writer", daemon=True)
+            self._thread.start()
+
+    def flush(self, now: float | None = None):
+        with book_lock:
+            closed = take_closed(now)
+        if not closed:
+            return
+        db = SessionLocal()
+        try:
+            save_candles(db, _rows(closed))
+        except Exception as e:
+            db.rollback()
+            with book_lock:                       # keep them for the next round
+                _closed[:0] = closed
+            log.error("[ERROR] Failed to save %s candles: %s", len(closed), e)
+        finally:
+            db.close()
+
+    def close(self):
+        """
+        Stop the thread and save every bar, the open ones too – a bar
+        continued after a restart is merged into the saved one.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush(now=float("inf"))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+candle_writer = CandleWriter()
@@ -1,86 +1,201 @@
 # matching_engine/consumer.py
 # ─────────────────────────── imports ────────────────────────────
-import json, threading, asyncio, pika, uvicorn
-from collections import defaultdict, deque
+import json, os, sys, threading, asyncio, subprocess, time, uvicorn, zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime   import datetime, UTC          # tz-aware stamps
-from typing     import Dict, Deque, Any
 
-from fastapi import FastAPI, WebSocket
-from matching_engine.ws_hub import register, unregister, broadcast
-from services.trade_logger  import record_trade
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from matching_engine.ws_hub import register, unregister, outbox, handle_message, watched
+from matching_engine.sinks  import make_sink, DbSink
 from db.database            import SessionLocal          # DB for balance ops
+from matching_engine.order_book import (Order, order_books, order_index, book_lock, find_order,
+                                        snapshot_json, to_ticks, PRICE_SCALE)
+from matching_engine.orderbook_api import Agg, book_etag, book_response, etag_response
+from matching_engine.journal    import Journal, Recent, JOURNAL_DIR, event_key
+from matching_engine.risk       import Ledger, ENGINE_RISK, check_config
+from matching_engine            import ticker, depth, candles
+from matching_engine.candles    import candle_writer
+from models.trade               import Trade
+from services.log               import get_logger
+from services.transport         import ORDER_TRANSPORT, make_transport
+from services                   import metrics
+from services.metrics           import Counter, Gauge, STAGE_LATENCY
+from services.sharding          import (ENGINE_SHARDS, ENGINE_BASE_PORT, ENGINE_URLS,
+                                        shard_for, shard_queue, fetch_json, fetch_cached, gather)
 
-# ────────────────────────── in-memory book ──────────────────────
-OrderBookSide = Deque[Dict[str, Any]]
-order_books: Dict[str, Dict[str, OrderBookSide]] = \
-    defaultdict(lambda: {"buy": deque(), "sell": deque()})
+# ──────────────────────────── config ────────────────────────────
+ENGINE_ACK_MODE   = os.getenv("ENGINE_ACK_MODE", "batch")      # batch / auto (rabbitmq)
+ENGINE_PREFETCH   = int(os.getenv("ENGINE_PREFETCH", "500"))   # basic_qos + max batch
+ENGINE_BATCH_WAIT = float(os.getenv("ENGINE_BATCH_WAIT", "0.005"))  # s, top-up wait
+ORDER_QUEUES      = ("order_queue", "order_amend_queue", "order_cancel_queue")
+SHARD             = int(os.getenv("ENGINE_SHARD", "0"))        # this worker's shard
+ENGINE_CAPTURE    = os.getenv("ENGINE_CAPTURE", "")            # NDJSON file of every consumed message
+ENGINE_COMMIT_TIMEOUT = float(os.getenv("ENGINE_COMMIT_TIMEOUT", "30"))  # s a batch waits for its fills
+REJECTS_KEPT      = 10_000                                     # refusals /orders/{id} remembers
+
+log = get_logger("engine")
 
-def _add(symbol: str, side: str, order: dict):
-    order_books[symbol][side].append(order)
+# ─────────────────────────── metrics ────────────────────────────
+MESSAGES   = Counter("engine_messages_total", "Order messages applied to the book", ["kind"])
+ERRORS     = Counter("engine_errors_total", "Order messages that failed to process")
+DUPLICATES = Counter("engine_duplicates_total", "Redelivered order messages skipped").child()
+FILLS      = Counter("engine_fills_total", "Fills matched").child()
+FILLED_QTY = Counter("engine_filled_quantity_total", "Shares matched").child()
+QUEUE_LAG  = Gauge("engine_queue_lag_seconds", "Publish → engine delay of the latest order message").child()
+_BY_KIND   = {k: MESSAGES.child(kind=k) for k in ("new", "amend", "cancel")}
+_QUEUE     = STAGE_LATENCY.child(stage="queue")
+_MATCH     = STAGE_LATENCY.child(stage="match")
+Gauge("engine_resting_orders", "Resting orders, all books", fn=lambda: len(order_index))
+Gauge("engine_book_levels", "Price levels, all books", ["side"],
+      fn=lambda: {s: sum(len(b[s].levels) for b in list(order_books.values()))
+                  for s in ("buy", "sell")})
 
-def _remove_first(symbol: str, side: str):
-    order_books[symbol][side].popleft()
+journal: Journal | None = None       # opened by recover(); JOURNAL_DIR="" disables
+recent  = Recent()                   # keys of the last ENGINE_DEDUP_WINDOW events applied
+trade_sink = make_sink()             # ENGINE_TRADE_SINK: db / memory / null
+replaying = False                    # True while rebuilding from the journal
+ledger: Ledger | None = None         # pre-trade risk, set up by seed_ledger(); ENGINE_RISK=off → none
+capture = None                       # ENGINE_CAPTURE file, opened by consume()
+acked   = False                      # set by consume(): the transport acks each batch
+stopping  = threading.Event()        # shutdown(): no batch starts after this
+# order_id → the risk checks' latest refusal for it, oldest first
+rejected: OrderedDict[int, dict] = OrderedDict()
+_in_batch = threading.Lock()         # held by the consumer thread for a whole batch
+
+# ────────────────────────── in-memory book ──────────────────────
+def _add(symbol: str, side: str, order: Order) -> bool:
+    return order_books[symbol][side].add(order)
+
+def _touch(symbol: str):
+    """Book changed: refresh the ticker's bid / ask and publish L2 deltas."""
+    book = order_books[symbol]
+    bid, ask = book.buy.best_tick(), book.sell.best_tick()
+    ticker.on_book(symbol, bid / PRICE_SCALE if bid is not None else None,
+                           ask / PRICE_SCALE if ask is not None else None)
+    if symbol not in watched("depth"):
+        depth.forget(book)
+        return
+    delta = depth.collect(book)
+    if delta and not replaying:
+        outbox.post(delta, channel="depth")
 
 def _find_order(order_id: int, user_id: int):
     """
     Return (symbol, side, order) or (None, None, None) if not found.
     """
-    for sym, book in order_books.items():
-        for side in ("buy", "sell"):
-            for o in book[side]:
-                if o["order_id"] == order_id and o["user_id"] == user_id:
-                    return sym, side, o
-    return None, None, None
+    o = find_order(order_id)
+    if o is None or o.user_id != user_id:
+        return None, None, None
+    return o.symbol, o.side, o
 
 # ───────────────────────── matching logic ───────────────────────
-def process_new(order: dict):
-    sym  = order["stock_symbol"].upper()
-    side = order["order_type"]             # buy / sell
+def _admit(kind: str, msg: dict) -> bool:
+    """Risk check for a new order or an amend; False = refused."""
+    if kind == "new":
+        reason = ledger.check_new(msg)
+        symbol = msg["stock_symbol"].upper()
+    elif kind == "amend":
+        o = find_order(msg["order_id"])
+        if o is None or o.user_id != msg["user_id"]:
+            return True                       # process_amend ignores it anyway
+        f = msg["fields"]
+        reason = ledger.check_amend(o, to_ticks(f["price"]) if "price" in f else o.ticks,
+                                    f.get("quantity", o.quantity))
+        symbol = o.symbol
+    else:
+        return True
+    if reason:
+        _reject(kind, symbol, msg, reason)
+    return not reason
+
+def _reject(kind: str, symbol: str, msg: dict, reason: str):
+    """Tell the client: /ws/trades gets a reject event, /orders/{id} keeps it."""
+    order_id = msg["order_id"]
+    log.info("[RISK] %s #%s from user %s refused: %s", kind, order_id, msg["user_id"], reason)
+    if replaying:
+        return
+    rejected[order_id] = {"kind": kind, "reason": reason, "sent_at": msg.get("sent_at")}
+    rejected.move_to_end(order_id)
+    while len(rejected) > REJECTS_KEPT:
+        rejected.popitem(last=False)
+    outbox.post({"type": "reject", "symbol": symbol, "order_id": order_id,
+                 "kind": kind, "reason": reason})
+
+def process_new(msg: dict):
+    if msg["order_id"] in order_index:        # redelivered longer ago than the window
+        log.warning("[DUP] new order #%s is already resting – ignored", msg["order_id"])
+        return
+    order = Order.from_msg(msg)
+    if ledger is not None:
+        ledger.reserve(order)
+    _match(order)
+
+def _match(order: Order):
+    """Cross an incoming (or re-entered) order, rest whatever is left."""
+    sym  = order.symbol
+    side = order.side                      # buy / sell
     opp  = "sell" if side == "buy" else "buy"
-    qty  = order["quantity"]
-    px   = order["price"]
+    qty  = order.quantity
+    px   = order.ticks
 
+    resting   = order_books[sym][opp]
     remaining = qty
-    while order_books[sym][opp] and remaining:
-        top = order_books[sym][opp][0]
-        tradable = (side == "buy"  and px >= top["price"]) or \
-                   (side == "sell" and px <= top["price"])
+    fills     = []                            # one WS message per incoming order
+    while remaining:
+        top = resting.best()                  # best price, oldest first
+        if top is None:
+            break
+        tradable = (side == "buy"  and px >= top.ticks) or \
+                   (side == "sell" and px <= top.ticks)
         if not tradable:
             break
 
-        trade_qty   = min(remaining, top["quantity"])
-        trade_price = top["price"]
-
-        print(f"[TRADE] {sym} {trade_qty} @ {trade_price}")
-
-        record_trade(                        # handles DB + cash
-            buyer_id   = order["user_id"] if side == "buy" else top["user_id"],
-            seller_id  = top["user_id"]    if side == "buy" else order["user_id"],
-            stock_symbol = sym,
-            price      = trade_price,
-            quantity   = trade_qty,
-        )
-
-        if loop:
-            asyncio.run_coroutine_threadsafe(
-                broadcast({
-                    "symbol":   sym,
-                    "price":    trade_price,
-                    "quantity": trade_qty,
-                    "timestamp": datetime.now(UTC).isoformat()
-                }),
-                loop
+        trade_qty   = min(remaining, top.quantity)
+        trade_price = top.ticks / PRICE_SCALE
+
+        log.debug("[TRADE] %s %s @ %s", sym, trade_qty, trade_price)
+
+        if ledger is not None:
+            if side == "buy":
+                ledger.fill(order, top, top.ticks, trade_qty)
+            else:
+                ledger.fill(top, order, top.ticks, trade_qty)
+
+        if not replaying:                    # replayed fills are already in DB
+            trade_sink.record(               # db: queued – DB + cash in batches
+                buyer_id   = order.user_id if side == "buy" else top.user_id,
+                seller_id  = top.user_id   if side == "buy" else order.user_id,
+                stock_symbol = sym,
+                price      = trade_price,
+                quantity   = trade_qty,
             )
 
-        remaining        -= trade_qty
-        top["quantity"]  -= trade_qty
-        if top["quantity"] == 0:
-            _remove_first(sym, opp)
+        ticker.on_fill(sym, trade_price, trade_qty)
+        if not replaying:
+            candles.on_fill(sym, trade_price, trade_qty)
+
+        if not replaying:
+            fills.append({
+                "price":    trade_price,
+                "quantity": trade_qty,
+                "timestamp": datetime.now(UTC).isoformat()
+            })
+
+        remaining -= trade_qty
+        resting.fill(top, trade_qty)          # drops it once fully filled
 
+    if fills:
+        FILLS.inc(len(fills))
+        FILLED_QTY.inc(qty - remaining)
+        outbox.post({"type": "trades", "symbol": sym, "trades": fills})
     if remaining:                             # still open
-        order["quantity"] = remaining
-        _add(sym, side, order)
-        print(f"[BOOK] ++ {side.upper()} {order}")
+        order.quantity = remaining
+        if _add(sym, side, order):
+            log.debug("[BOOK] ++ %s %s", side.upper(), order)
+        elif ledger is not None:
+            ledger.release(order, remaining)  # never rested – nothing to reserve for
+    _touch(sym)
 
 def process_amend(payload: dict):
     order_id = payload["order_id"]
@@ -89,11 +204,30 @@ def process_amend(payload: dict):
 
     sym, side, order = _find_order(order_id, user_id)
     if not order:
-        print(f"[AMEND] order #{order_id} NOT found – ignored")
+        log.debug("[AMEND] order #%s NOT found – ignored", order_id)
         return
 
-    order.update(fields)
-    print(f"[AMEND] order #{order_id} updated → {order}")
+    px  = to_ticks(fields["price"]) if "price" in fields else order.ticks
+    qty = fields.get("quantity", order.quantity)
+
+    if px == order.ticks and qty <= order.quantity:
+        if ledger is not None:
+            ledger.release(order, order.quantity - qty)
+        order_books[sym][side].resize(order, qty)   # shrink in place, keeps priority
+        _touch(sym)
+        log.debug("[AMEND] order #%s updated → %s", order_id, order)
+        return
+
+    # new price or bigger size loses time priority – re-enter the order,
+    # which may also make it marketable against the other side
+    order_books[sym][side].remove(order)
+    if ledger is not None:
+        ledger.release(order, order.quantity)
+    order.ticks, order.quantity = px, qty
+    if ledger is not None:
+        ledger.reserve(order)
+    log.debug("[AMEND] order #%s re-entered @ %s x %s", order_id, order.price, qty)
+    _match(order)
 
 def process_cancel(payload: dict):
     order_id = payload["order_id"]
@@ -101,66 +235,359 @@ def process_cancel(payload: dict):
 
     sym, side, order = _find_order(order_id, user_id)
     if not order:
-        print(f"[CANCEL] order #{order_id} NOT found – ignored")
+        log.debug("[CANCEL] order #%s NOT found – ignored", order_id)
         return
 
     order_books[sym][side].remove(order)
-    print(f"[CANCEL] order #{order_id} removed")
+    if ledger is not None:
+        ledger.release(order, order.quantity)
+    _touch(sym)
+    log.debug("[CANCEL] order #%s removed", order_id)
 
 # ─────────────────────── RabbitMQ consumer ──────────────────────
-def consume():
-    conn = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
-    ch   = conn.channel()
-    ch.queue_declare("order_queue")
-    ch.queue_declare("order_amend_queue")
-    ch.queue_declare("order_cancel_queue")
+def dispatch(msg: dict):
+    kind = msg.get("kind") or "new"           # fallback for old producers
+    if kind not in ("new", "amend", "cancel"):
+        log.warning("[WARN] unknown kind: %r", kind)
+        return
+    key = event_key(msg)
+    if key in recent:                         # redelivered (broker retry, crash before ack)
+        DUPLICATES.inc()
+        log.debug("[DUP] %s #%s already applied – ignored", kind, msg["order_id"])
+        return
 
-    def cb(_ch, _m, _p, body):
-        msg = json.loads(body)
-        kind = msg.get("kind") or "new"       # fallback for old producers
+    started = time.perf_counter()
+    sent_at = msg.get("sent_at")              # stamped by the API on publish
+    if sent_at and not replaying:
+        lag = max(time.time() - sent_at, 0.0)
+        _QUEUE.observe(lag)
+        QUEUE_LAG.set(lag)
 
+    with book_lock:
+        recent.add(key)
+        if ledger is not None and not _admit(kind, msg):
+            return                            # refused – never journaled
+        if journal and not replaying:
+            journal.append(msg)               # write-ahead: before the book moves
         if   kind == "new":    process_new(msg)
         elif kind == "amend":  process_amend(msg)
-        elif kind == "cancel": process_cancel(msg)
-        else:
-            print(f"[WARN] unknown kind: {kind!r}")
+        else:                  process_cancel(msg)
+
+    if not replaying:
+        _BY_KIND[kind].inc()
+        _MATCH.observe(time.perf_counter() - started)
+
+def seed_tickers():
+    """Last traded price per owned symbol, once at startup."""
+    db = SessionLocal()
+    try:
+        rows = (db.query(Trade.stock_symbol, Trade.price)
+                  .distinct(Trade.stock_symbol)
+                  .order_by(Trade.stock_symbol, Trade.timestamp.desc())
+                  .all())
+    except Exception as e:
+        log.warning("[WARN] could not seed tickers: %r", e)
+        return
+    finally:
+        db.close()
+    for sym, px in rows:
+        if shard_for(sym) == SHARD:
+            ticker.seed_last(sym, px)
+
+def seed_ledger():
+    """Risk ledger from balances / positions plus the recovered books."""
+    global ledger
+    if ENGINE_RISK == "off":
+        return
+    new = Ledger(ENGINE_RISK, owns=lambda sym: shard_for(sym) == SHARD)
+    try:
+        n = new.seed(order_index.values())
+    except Exception as e:
+        log.error("[RISK] could not seed the ledger – risk checks are OFF: %r", e)
+        return
+    ledger = new
+    log.info("[RISK] ledger seeded: %s accounts, %s checks", n, ENGINE_RISK)
+
+def recover():
+    """Load the latest book snapshot and replay the journal tail."""
+    global journal, replaying
+    if not JOURNAL_DIR:
+        return
+    directory = JOURNAL_DIR if ENGINE_SHARDS == 1 else os.path.join(JOURNAL_DIR, f"shard-{SHARD}")
+    journal   = Journal(directory, recent=recent)
+    replaying = True
+    try:
+        n = journal.recover(dispatch)
+    finally:
+        replaying = False
+    log.info("[ENGINE] recovered books at seq %s (%s events replayed)", journal.seq, n)
+
+class FillsNotCommitted(RuntimeError):
+    """A batch's fills could not be written; it must not be acked."""
 
-    ch.basic_consume("order_queue",        cb, auto_ack=True)
-    ch.basic_consume("order_amend_queue",  cb, auto_ack=True)
-    ch.basic_consume("order_cancel_queue", cb, auto_ack=True)
+class EngineStopped(RuntimeError):
+    """Shutdown began before this batch was applied; it must not be acked."""
 
-    print("[ENGINE] Waiting for orders / amends / cancels …")
-    ch.start_consuming()
+def _commit_fills() -> bool:
+    """Wait (up to ENGINE_COMMIT_TIMEOUT) for the trade sink to commit every fill."""
+    deadline = time.monotonic() + ENGINE_COMMIT_TIMEOUT
+    while not trade_sink.flush(ENGINE_COMMIT_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        log.warning("[ENGINE] fills not committed yet – batch held, not acked")
+        time.sleep(1.0)
+    return True
+
+def handle_batch(bodies: list[bytes]):
+    """
+    Apply a batch in delivery order.  When the transport acks batches
+    (rabbitmq, batch mode) the trade writer has committed its fills and
+    the journal is on disk before this returns – the ack comes after that
+    (at-least-once).  If the fills can't be committed the batch's journal
+    events are dropped and FillsNotCommitted is raised, so it is never
+    acked.  Transports that ack nothing don't wait: fills are committed by
+    the writer in the background and the journal is written, not fsynced.
+    Once shutdown() has begun, a batch is refused whole with EngineStopped.
+    """
+    with _in_batch:
+        if stopping.is_set():
+            raise EngineStopped("engine is shutting down")
+        if capture:                                  # for matching_engine.replay
+            capture.write(b"\n".join(bodies) + b"\n")
+            capture.flush()
+        for body in bodies:
+            try:
+                dispatch(json.loads(body))
+            except Exception as e:                   # poison message
+                ERRORS.inc()
+                log.error("[ERROR] failed to process %r: %r", body[:200], e)
+        if acked:
+            if not _commit_fills():
+                if journal:
+                    journal.discard()                # never on disk, redelivered instead
+                raise FillsNotCommitted(f"fills of a {len(bodies)}-message batch not committed "
+                                        f"after {ENGINE_COMMIT_TIMEOUT}s")
+            if journal:
+                journal.sync()                       # events durable
+        elif journal:
+            journal.write()
+        if journal:
+            journal.maybe_snapshot()
+
+def shutdown():
+    """
+    Stop taking batches, let the one in flight finish (fills committed,
+    journal written), then flush and close the sink, candles and journal.
+    Blocks – up to ENGINE_COMMIT_TIMEOUT for the batch in flight.
+    """
+    stopping.set()
+    with _in_batch:                                  # nothing is mid-batch from here on
+        if ledger is not None:
+            ledger.close()
+        trade_sink.close()
+        candle_writer.close()
+        if journal:
+            journal.close()
+
+def consume():
+    global capture, acked
+    queues = [shard_queue(q, SHARD) for q in ORDER_QUEUES]
+    if ENGINE_CAPTURE:
+        path    = ENGINE_CAPTURE if ENGINE_SHARDS == 1 else f"{ENGINE_CAPTURE}.{SHARD}"
+        capture = open(path, "ab")
+        log.info("[ENGINE] capturing order messages to %s", path)
+    log.info("[ENGINE] Waiting for orders / amends / cancels on %s "
+             "(%s ack, prefetch=%s) …", ORDER_TRANSPORT, ENGINE_ACK_MODE, ENGINE_PREFETCH)
+    transport = make_transport()
+    acked     = transport.acks(ENGINE_ACK_MODE)
+    try:
+        transport.consume(queues, handle_batch, prefetch=ENGINE_PREFETCH,
+                          wait=ENGINE_BATCH_WAIT, ack_mode=ENGINE_ACK_MODE)
+    except EngineStopped:
+        log.info("[ENGINE] stopped consuming (shutdown)")
+    except FillsNotCommitted as e:
+        # the books already moved past what the journal holds: stop, and let
+        # a restart recover them while the broker redelivers the batch
+        log.critical("[ENGINE] %s – exiting so the batch is redelivered onto recovered books", e)
+        os._exit(1)
 
 # ───────────────────────── FastAPI app ──────────────────────────
 api  = FastAPI(title="Order-Book API")
-loop: asyncio.AbstractEventLoop | None = None
 
 @api.on_event("startup")
 async def _set_loop():                 # capture main event-loop for WS push
-    global loop
-    loop = asyncio.get_running_loop()
+    outbox.bind(asyncio.get_running_loop())
+    trade_sink.start()
+    candle_writer.start()
+    if ledger is not None and isinstance(trade_sink, DbSink):
+        ledger.start(trade_sink.flush)     # reconcile against balances
+
+@api.on_event("shutdown")
+async def _flush_trades():             # drain the consumer, then durable flush of queued fills
+    await asyncio.to_thread(shutdown)
 
 @api.websocket("/ws/trades")
 async def ws_trades(ws: WebSocket):
     await register(ws)
     try:
-        while True:
-            await ws.receive_text()
+        while True:                    # client → server: subscriptions only
+            handle_message(ws, await ws.receive_text())
+    except Exception:
+        unregister(ws)
+
+@api.websocket("/ws/depth")
+async def ws_depth(ws: WebSocket):
+    client = await register(ws, channel="depth")
+    try:
+        while True:                    # snapshot per new subscription, then deltas
+            for sym in handle_message(ws, await ws.receive_text()):
+                with book_lock:               # .get: a junk symbol must not create a book
+                    book = order_books.get(sym)
+                    snap = depth.snapshot(book) if book else depth.empty(sym)
+                client.offer(json.dumps(snap))
     except Exception:
         unregister(ws)
 
+# ?depth=N&agg=order|level, ETag / If-None-Match – see orderbook_api.py
+Levels = Query(None, ge=1, alias="depth")
+
+# merged /order-book: every shard's part is revalidated by its ETag and the
+# merged body is only rebuilt when one of them changed
+_book_parts:  dict[tuple, tuple[str, dict]]  = {}   # (shard, depth, agg) → (ETag, books)
+_book_merged: dict[tuple, tuple[str, bytes]] = {}   # (depth, agg) → (ETag, body)
+
+def _book_part(shard: int, levels: int | None, agg: str) -> tuple[str, dict]:
+    key    = (shard, levels, agg)
+    cached = _book_parts.get(key)
+    if shard == SHARD:
+        version, body = snapshot_json(None, levels, agg)
+        etag = book_etag(None, levels, agg, version)
+    else:
+        query = f"local=true&agg={agg}" + (f"&depth={levels}" if levels else "")
+        status, etag, body = fetch_cached(f"{ENGINE_URLS[shard]}/order-book?{query}",
+                                          cached[0] if cached else None)
+        if status not in (200, 304) or (status == 304 and cached is None):
+            raise HTTPException(502, f"shard {shard} answered {status}")
+    if cached is None or cached[0] != etag:
+        cached = _book_parts[key] = (etag, json.loads(body))
+    return cached
+
 @api.get("/order-book")
-def get_all():
-    return {s: {"buy": list(b["buy"]), "sell": list(b["sell"])}
-            for s, b in order_books.items()}
+def get_all(request: Request, local: bool = False,
+            levels: int | None = Levels, agg: Agg = "order"):
+    if local or ENGINE_SHARDS == 1:
+        return book_response(request, None, levels, agg)
+    with ThreadPoolExecutor(max_workers=ENGINE_SHARDS) as pool:
+        parts = list(pool.map(lambda i: _book_part(i, levels, agg), range(ENGINE_SHARDS)))
+    tags   = "|".join(etag for etag, _books in parts).encode()
+    etag   = book_etag(None, levels, agg, f"{zlib.crc32(tags):08x}")
+    cached = _book_merged.get((levels, agg))
+    if cached is None or cached[0] != etag:
+        books = {}
+        for _etag, part in parts:
+            books.update(part)
+        cached = _book_merged[(levels, agg)] = (etag, json.dumps(books).encode())
+    return etag_response(request, etag, cached[1])
 
 @api.get("/order-book/{symbol}")
-def get_one(symbol: str):
-    b = order_books.get(symbol.upper(), {"buy": [], "sell": []})
-    return {"symbol": symbol.upper(), "buy": list(b["buy"]), "sell": list(b["sell"])}
+def get_one(request: Request, symbol: str,
+            levels: int | None = Levels, agg: Agg = "order"):
+    owner = shard_for(symbol)
+    if owner != SHARD:                            # symbol lives elsewhere – pass through
+        status, etag, body = fetch_cached(f"{ENGINE_URLS[owner]}/order-book/{symbol.upper()}"
+                                          f"?{request.url.query}",
+                                          request.headers.get("if-none-match"))
+        return Response(body, status_code=status,
+                        media_type=None if status == 304 else "application/json",
+                        headers={"ETag": etag} if etag else None)
+    return book_response(request, symbol, levels, agg)
+
+@api.get("/ticker")
+def get_tickers(local: bool = False):
+    out = ticker.snapshot()
+    if not local and ENGINE_SHARDS > 1:
+        for other in gather("/ticker?local=true", skip=SHARD):
+            out.update(other)
+    return out
+
+@api.get("/ticker/{symbol}")
+def get_ticker(symbol: str):
+    owner = shard_for(symbol)
+    if owner != SHARD:
+        return fetch_json(f"{ENGINE_URLS[owner]}/ticker/{symbol.upper()}")
+    return ticker.snapshot(symbol)
+
+@api.get("/candles/{symbol}")
+def get_candle(symbol: str, interval: str = "1m"):
+    """The symbol's still-open bar (closed ones are in the candles table)."""
+    owner = shard_for(symbol)
+    if owner != SHARD:
+        return fetch_json(f"{ENGINE_URLS[owner]}/candles/{symbol.upper()}?interval={interval}")
+    with book_lock:
+        return candles.current(symbol, interval)
+
+@api.get("/orders/{order_id}")
+def get_order(order_id: int):
+    """
+    What this engine knows of an order: the resting record (None once
+    filled, cancelled or before it arrived) and the risk checks' latest
+    refusal of it or of an amend to it (None if there was none).
+    """
+    with book_lock:
+        o = find_order(order_id)
+        return {"order_id": order_id,
+                "resting":  o.as_dict() if o else None,
+                "rejected": rejected.get(order_id)}
+
+@api.get("/risk/{user_id}")
+def get_risk(user_id: int):
+    """The user's ledger account on this shard (cash, reservations, shares)."""
+    if ledger is None:
+        raise HTTPException(404, "Risk checks are off")
+    with book_lock:
+        a = ledger.accounts.get(user_id)
+        if a is None:
+            raise HTTPException(404, "Unknown account")
+        return a.as_dict()
+
+@api.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus text format – this shard only."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # ────────────────────────── launcher ────────────────────────────
+def spawn_all():
+    """Start one worker process per shard and wait for them."""
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "matching_engine.consumer", "--shard", str(i)])
+        for i in range(ENGINE_SHARDS)
+    ]
+    try:
+        for p in procs:
+            p.wait()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+
 if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="StockSim matching engine")
+    ap.add_argument("--shard", type=int, default=None,
+                    help="run one worker for this shard (0 … ENGINE_SHARDS-1)")
+    args = ap.parse_args()
+
+    problem = check_config(ENGINE_RISK, ENGINE_SHARDS)
+    if problem:                        # risk checks that can't hold – don't run
+        log.critical("[RISK] refusing to start: %s", problem)
+        sys.exit(1)
+
+    if args.shard is None and ENGINE_SHARDS > 1:
+        spawn_all()
+        sys.exit(0)
+
+    SHARD = args.shard if args.shard is not None else SHARD
+    seed_tickers()
+    recover()                          # books back before we consume
+    seed_ledger()                      # … and the risk ledger from them
     threading.Thread(target=consume, daemon=True).start()
-    uvicorn.run(api, host="0.0.0.0", port=8001)
+    uvicorn.run(api, host="0.0.0.0", port=ENGINE_BASE_PORT + SHARD)
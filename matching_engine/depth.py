@@ -0,0 +1,115 @@
+# matching_engine/depth.py
+# Aggregated L2 depth (top DEPTH_LEVELS price levels per side).
+#
+# The engine calls collect(book) after every message that touched a
+# symbol somebody watches (forget(book) otherwise, which keeps unwatched
+# symbols free).  It compares the book's current top-N levels with what
+# was last published and returns a sequence-numbered delta:
+#   {"type": "delta", "symbol": "AAPL", "seq": 42,
+#    "bids": [[101.5, 300], [101.0, 0]],  "asks": [[102.0, 50]]}
+# where a quantity of 0 removes the level.  snapshot() gives the full
+# published top-N with the seq it corresponds to (call it under
+# book_lock); a client applies only deltas with a higher seq and
+# resubscribes if it ever sees a gap.  empty(symbol) is the snapshot for a
+# symbol that has no book – nothing is created for it.
+#
+# Deltas are worked out from the changed levels only; the top-N is only
+# re-read from the book (BookSide.top_ticks) when a level inside it
+# disappears.  Levels are kept in integer ticks like the book and turned
+# into prices when a message is built.
+import os
+from typing import Dict
+
+from matching_engine.order_book import BookSide, OrderBook, PRICE_SCALE
+
+DEPTH_LEVELS = int(os.getenv("DEPTH_LEVELS", "10"))
+
+# symbol → (seq, bids, asks); bids / asks are None while nobody watches
+_published: Dict[str, tuple[int, dict | None, dict | None]] = {}
+
+
+def _top(side: BookSide, n: int) -> dict[int, int]:
+    return {px: side.depth[px] for px in side.top_ticks(n)}
+
+def _levels(levels: dict, side: str) -> list:
+    return [[px / PRICE_SCALE, q]
+            for px, q in sorted(levels.items(), reverse=(side == "buy"))]
+
+def _side_delta(side: BookSide, pub: dict, n: int):
+    """
+    New top-N for one side plus the [price, qty] changes against `pub`.
+    Levels outside `pub` that didn't change are all worse than its worst
+    level, so only changed prices need looking at – unless the top-N
+    shrank below n while deeper levels exist, which needs one rescan.
+    """
+    if not side.changed:
+        return pub, []
+    buy = side.side == "buy"
+    if len(pub) < n:                          # top-N not full: all count
+        hits = list(side.changed)
+    else:
+        worst = min(pub) if buy else max(pub)
+        hits  = [px for px in side.changed
+                 if px in pub or (px > worst if buy else px < worst)]
+    side.changed.clear()
+    if not hits:
+        return pub, []
+
+    new = dict(pub)
+    for px in hits:
+        qty = side.depth.get(px, 0)
+        if qty:
+            new[px] = qty
+        else:
+            new.pop(px, None)
+
+    if len(new) > n:
+        new = dict(sorted(new.items(), reverse=buy)[:n])
+    elif len(new) < n and len(side.depth) > len(new):
+        new = _top(side, n)                       # a top level went away
+
+    diff = {px: q for px, q in new.items() if pub.get(px) != q}
+    diff.update({px: 0 for px in pub if px not in new})
+    return (new if diff else pub), _levels(diff, side.side)
+
+def collect(book: OrderBook, n: int = DEPTH_LEVELS) -> dict | None:
+    """Delta for this book since the last call, or None if the top-N is unchanged."""
+    seq, bids, asks = _published.get(book.symbol, (0, None, None))
+    if bids is None:                          # cold: everything is new
+        bids, asks = {}, {}
+    bids, d_bids = _side_delta(book.buy,  bids, n)
+    asks, d_asks = _side_delta(book.sell, asks, n)
+    if not d_bids and not d_asks:
+        return None
+    seq += 1
+    _published[book.symbol] = (seq, bids, asks)
+    return {"type": "delta", "symbol": book.symbol, "seq": seq,
+            "bids": d_bids, "asks": d_asks}
+
+def forget(book: OrderBook):
+    """Nobody watches this symbol: drop pending changes, go cold (seq kept)."""
+    book.buy.changed.clear()
+    book.sell.changed.clear()
+    seq, bids, _ = _published.get(book.symbol, (0, None, None))
+    if bids is not None:
+        _published[book.symbol] = (seq, None, None)
+
+def snapshot(book: OrderBook, n: int = DEPTH_LEVELS) -> dict:
+    """Published top-N for a new subscriber (warms a cold symbol up)."""
+    seq, bids, asks = _published.get(book.symbol, (0, None, None))
+    if bids is None:
+        book.buy.changed.clear()
+        book.sell.changed.clear()
+        seq, bids, asks = seq + 1, _top(book.buy, n), _top(book.sell, n)
+        _published[book.symbol] = (seq, bids, asks)
+    return {"type": "snapshot", "symbol": book.symbol, "seq": seq,
+            "bids": _levels(bids, "buy"), "asks": _levels(asks, "sell")}
+
+def reset():
+    """Forget everything published (fresh books: replays, benchmarks)."""
+    _published.clear()
+
+def empty(symbol: str) -> dict:
+    """Snapshot of a symbol with no book (yet); its first delta will be seq + 1."""
+    seq = _published.get(symbol, (0, None, None))[0]
+    return {"type": "snapshot", "symbol": symbol, "seq": seq, "bids": [], "asks": []}
@@ -0,0 +1,339 @@
+# matching_engine/journal.py
+# Append-only binary journal + periodic snapshots of the in-memory books.
+#
+#   JOURNAL_DIR/
+#     snapshot.bin                 ← resting orders as of event #seq
+#     journal-000000000001.bin     ← events seq 1 …
+#     journal-000000100001.bin     ← events seq 100001 … (after a snapshot)
+#
+# Every frame is  <len:u32><crc32:u32><record>,  and a record is one of
+#   new     B kind=1, q order_id, q user_id, B side, d price, q qty, H len, symbol
+#   amend   B kind=2, q order_id, q user_id, d price|NaN, q qty|-1
+#   cancel  B kind=3, q order_id, q user_id
+# followed by the message's sent_at (d, NaN if it had none) – records
+# written before it was added are simply shorter.  A torn frame at the tail (crash mid-write) is detected by length / CRC
+# and cut off on recovery.
+#
+# append() only stages a frame; write() / sync() put the staged batch in
+# the file once the consumer knows the batch is done, and discard() drops
+# it when it isn't (its fills could not be committed), so the file never
+# holds events whose fills are missing from Postgres.
+#
+# Redeliveries are spotted by event_key(): the engine remembers the keys
+# of the last ENGINE_DEDUP_WINDOW events (Recent) and skips a message it
+# has already applied.  A snapshot stores that window next to the books
+#   <magic "SSIMSNP2"><seq:q><keys:q>, `keys` key frames (B kind, q
+#   order_id, d sent_at|NaN), then one "new" frame per resting order
+# because it deletes the segments the keys would otherwise be replayed
+# from – a batch snapshotted but not yet acked is still recognised when
+# the broker hands it back.  SSIMSNP1 snapshots (no keys) still load.
+#
+# Startup = load snapshot, then replay only the journal segments written
+# after it.  Writing a snapshot starts a new segment and deletes the old
+# ones, so recovery time is bounded by SNAPSHOT_EVERY, not by history.
+import math, os, struct, zlib
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+from matching_engine.order_book import Order, order_books
+from services.log import get_logger
+
+log = get_logger("journal")
+
+JOURNAL_DIR    = os.getenv("JOURNAL_DIR", "journal")
+SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "100000"))   # events
+DEDUP_WINDOW   = int(os.getenv("ENGINE_DEDUP_WINDOW", "100000"))      # event keys kept
+
+_FRAME  = struct.Struct("<II")
+_NEW    = struct.Struct("<BqqBdqH")
+_AMEND  = struct.Struct("<Bqqdq")
+_CANCEL = struct.Struct("<Bqq")
+_STAMP  = struct.Struct("<d")                     # sent_at trailer
+_SNAP   = struct.Struct("<8sq")                   # magic, seq
+_NKEYS  = struct.Struct("<q")                     # SSIMSNP2: key frames that follow
+_KEY    = struct.Struct("<Bqd")                   # kind, order_id, sent_at|NaN
+_MAGIC  = b"SSIMSNP2"
+_MAGIC1 = b"SSIMSNP1"                             # books only
+
+_SIDES  = ("buy", "sell")
+_KINDS  = {1: "new", 2: "amend", 3: "cancel"}
+_CODES  = {k: c for c, k in _KINDS.items()}
+
+
+# ─────────────────────────── encoding ───────────────────────────
+def encode(msg: dict) -> bytes:
+    kind  = msg.get("kind") or "new"
+    stamp = _STAMP.pack(msg.get("sent_at") or math.nan)
+    if kind == "new":
+        sym = msg["stock_symbol"].upper().encode()
+        return _NEW.pack(1, msg["order_id"], msg["user_id"],
+                         _SIDES.index(msg["order_type"]), msg["price"],
+                         msg["quantity"], len(sym)) + sym + stamp
+    if kind == "amend":
+        f = msg["fields"]
+        return _AMEND.pack(2, msg["order_id"], msg["user_id"],
+                           f.get("price", math.nan), f.get("quantity", -1)) + stamp
+    if kind == "cancel":
+        return _CANCEL.pack(3, msg["order_id"], msg["user_id"]) + stamp
+    raise ValueError(f"cannot journal kind {kind!r}")
+
+def _stamped(msg: dict, rec: bytes, end: int) -> dict:
+    if len(rec) >= end + _STAMP.size:
+        (sent,) = _STAMP.unpack_from(rec, end)
+        if not math.isnan(sent):
+            msg["sent_at"] = sent
+    return msg
+
+def decode(rec: bytes) -> dict:
+    kind = _KINDS[rec[0]]
+    if kind == "new":
+        _, oid, uid, side, px, qty, n = _NEW.unpack_from(rec)
+        sym = rec[_NEW.size:_NEW.size + n].decode()
+        return _stamped({"kind": "new", "order_id": oid, "user_id": uid,
+                         "stock_symbol": sym, "quantity": qty, "price": px,
+                         "order_type": _SIDES[side]}, rec, _NEW.size + n)
+    if kind == "amend":
+        _, oid, uid, px, qty = _AMEND.unpack_from(rec)
+        fields = {}
+        if not math.isnan(px):
+            fields["price"] = px
+        if qty >= 0:
+            fields["quantity"] = qty
+        return _stamped({"kind": "amend", "order_id": oid, "user_id": uid, "fields": fields},
+                        rec, _AMEND.size)
+    _, oid, uid = _CANCEL.unpack_from(rec)
+    return _stamped({"kind": "cancel", "order_id": oid, "user_id": uid}, rec, _CANCEL.size)
+
+def event_key(msg: dict) -> tuple | None:
+    """
+    Identity of an order message for spotting redeliveries.  A new order
+    is its id; an amend or cancel needs the publish stamp too, since the
+    same order can be amended to the same values more than once – without
+    one (old producers, benchmarks) it has no identity and None is returned.
+    """
+    kind = msg.get("kind") or "new"
+    if kind == "new":
+        return ("new", msg["order_id"])
+    sent = msg.get("sent_at")
+    return (kind, msg["order_id"], sent) if sent is not None else None
+
+def _encode_key(key: tuple) -> bytes:
+    return _KEY.pack(_CODES[key[0]], key[1], key[2] if len(key) > 2 else math.nan)
+
+def _decode_key(rec: bytes) -> tuple:
+    code, oid, sent = _KEY.unpack(rec)
+    return ("new", oid) if code == 1 else (_KINDS[code], oid, sent)
+
+def _frame(rec: bytes) -> bytes:
+    return _FRAME.pack(len(rec), zlib.crc32(rec)) + rec
+
+def _frames(path: str, start: int = 0) -> Iterator[tuple[int, bytes]]:
+    """Yield (end_offset, record) for every intact frame in a file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = start
+    while pos + _FRAME.size <= len(data):
+        n, crc = _FRAME.unpack_from(data, pos)
+        rec    = data[pos + _FRAME.size:pos + _FRAME.size + n]
+        if len(rec) < n or zlib.crc32(rec) != crc:
+            return                                # torn tail
+        pos += _FRAME.size + n
+        yield pos, rec
+
+
+def read_segment(path: str) -> Iterator[dict]:
+    """The events of one journal segment, in order, up to any torn tail."""
+    for _end, rec in _frames(path):
+        yield decode(rec)
+
+def read_snapshot(path: str) -> tuple[int, list[tuple], list[dict]]:
+    """(seq, event keys, resting orders as "new" messages) of a snapshot file."""
+    with open(path, "rb") as f:
+        head = f.read(_SNAP.size + _NKEYS.size)
+    magic, seq = _SNAP.unpack_from(head)
+    if magic == _MAGIC:
+        (nkeys,) = _NKEYS.unpack_from(head, _SNAP.size)
+        start    = _SNAP.size + _NKEYS.size
+    elif magic == _MAGIC1:
+        nkeys, start = 0, _SNAP.size
+    else:
+        raise RuntimeError(f"{path}: not a book snapshot")
+    keys, orders = [], []
+    for i, (_end, rec) in enumerate(_frames(path, start)):
+        if i < nkeys:
+            keys.append(_decode_key(rec))
+        else:
+            orders.append(decode(rec))
+    return seq, keys, orders
+
+
+# ─────────────────────────── dedup window ───────────────────────
+class Recent:
+    """The keys of the last `size` events applied, oldest first."""
+
+    def __init__(self, size: int = DEDUP_WINDOW):
+        self.size = size
+        self._order: deque[tuple] = deque()
+        self._keys:  set[tuple]   = set()
+
+    def __contains__(self, key: tuple | None) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self._order)
+
+    def add(self, key: tuple | None):
+        if key is None or key in self._keys:
+            return
+        self._order.append(key)
+        self._keys.add(key)
+        if len(self._order) > self.size:
+            self._keys.discard(self._order.popleft())
+
+    def update(self, keys: Iterable[tuple]):
+        for key in keys:
+            self.add(key)
+
+    def clear(self):
+        self._order.clear()
+        self._keys.clear()
+
+
+# ─────────────────────────── journal ────────────────────────────
+class Journal:
+    def __init__(self, directory: str = JOURNAL_DIR, snapshot_every: int = SNAPSHOT_EVERY,
+                 recent: Recent | None = None):
+        self.dir            = directory
+        self.snapshot_every = snapshot_every
+        self.seq            = 0                   # last event written
+        self._snap_seq      = 0
+        self._fh            = None
+        self._staged: list[bytes] = []            # frames of the batch in progress
+        # what the engine dedups against (filled in by `apply` on replay);
+        # saved with every snapshot, restored from it on recover()
+        self.recent = recent if recent is not None else Recent()
+        os.makedirs(self.dir, exist_ok=True)
+
+    # ---- paths --------------------------------------------------------
+    def _segment(self, first_seq: int) -> str:
+        return os.path.join(self.dir, f"journal-{first_seq:012d}.bin")
+
+    def _segments(self) -> list[tuple[int, str]]:
+        out = []
+        for name in os.listdir(self.dir):
+            if name.startswith("journal-") and name.endswith(".bin"):
+                out.append((int(name[8:-4]), os.path.join(self.dir, name)))
+        return sorted(out)
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.dir, "snapshot.bin")
+
+    # ---- startup ------------------------------------------------------
+    def recover(self, apply: Callable[[dict], None]) -> int:
+        """
+        Rebuild `order_books` and the dedup window from the snapshot and
+        replay the journal tail through `apply` (the engine's dispatch,
+        which adds the replayed keys).  Returns events replayed.
+        """
+        self.seq = self._snap_seq = self._load_snapshot()
+        replayed = 0
+        tail     = None
+        for first, path in self._segments():
+            seq, good_end = first - 1, 0
+            for end, rec in _frames(path):
+                seq += 1
+                good_end = end
+                if seq <= self.seq:
+                    continue                      # already in the snapshot
+                msg = decode(rec)
+                try:
+                    apply(msg)
+                except Exception as e:            # same as the live consumer
+                    log.error("[JOURNAL] event #%s failed on replay: %r", seq, e)
+                self.seq = seq
+                replayed += 1
+            if os.path.getsize(path) != good_end:
+                with open(path, "r+b") as f:      # drop torn tail
+                    f.truncate(good_end)
+            tail = path
+        self._fh = open(tail or self._segment(self.seq + 1), "ab")
+        return replayed
+
+    def _load_snapshot(self) -> int:
+        if not os.path.exists(self._snapshot_path):
+            return 0
+        seq, keys, orders = read_snapshot(self._snapshot_path)
+        self.recent.update(keys)
+        for msg in orders:
+            o = Order.from_msg(msg)
+            order_books[o.symbol][o.side].add(o)
+        return seq
+
+    # ---- hot path -----------------------------------------------------
+    def append(self, msg: dict):
+        self._staged.append(_frame(encode(msg)))
+        self.seq += 1
+
+    def write(self):
+        """Hand the staged events to the OS (no fsync)."""
+        if self._staged:
+            self._fh.write(b"".join(self._staged))
+            self._staged.clear()
+        self._fh.flush()
+
+    def sync(self):
+        """Make everything appended so far durable (call before acking)."""
+        self.write()
+        os.fsync(self._fh.fileno())
+
+    def discard(self):
+        """Forget the staged events – their batch will be delivered again."""
+        self.seq -= len(self._staged)
+        self._staged.clear()
+
+    # ---- snapshots ----------------------------------------------------
+    def maybe_snapshot(self):
+        if self.seq - self._snap_seq >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """Write the current books and dedup window, then start a fresh journal segment."""
+        self.sync()
+        tmp = self._snapshot_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_SNAP.pack(_MAGIC, self.seq) + _NKEYS.pack(len(self.recent)))
+            f.write(b"".join(_frame(_encode_key(k)) for k in self.recent))
+            for book in list(order_books.values()):
+                for side in _SIDES:
+                    for o in book[side]:          # priority order → FIFO kept
+                        f.write(_frame(encode(o.as_dict())))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._snapshot_path)
+
+        old = self._segments()
+        new = self._segment(self.seq + 1)
+        self._fh.close()
+        self._fh = open(new, "ab")
+        for _first, path in old:
+            if path != new:
+                os.remove(path)
+        self._snap_seq = self.seq
+        log.info("[JOURNAL] snapshot @ seq %s", self.seq)
+
+    def close(self):
+        """
+        Sync what was written and close.  Frames still staged belong to a
+        batch that never finished, so they are dropped, not written.
+        """
+        if self._staged:
+            log.warning("[JOURNAL] closing with %s staged events – dropped", len(self._staged))
+            self.discard()
+        if self._fh:
+            self.sync()
+            self._fh.close()
+            self._fh = None
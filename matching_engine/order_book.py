@@ -1,32 +1,331 @@
-from collections import defaultdict, deque
+# matching_engine/order_book.py
+# Price-time priority limit order book.
+#
+#   OrderBook("AAPL")
+#     ├─ buy  : BookSide  – best = highest price
+#     └─ sell : BookSide  – best = lowest price
+#
+# Resting orders are Order records (__slots__, integer price ticks,
+# interned symbol / side strings) rather than the message dicts they came
+# from – about a third of the memory, and level lookups hash and compare
+# ints.  They turn back into dicts only at the API boundary (as_dict,
+# view, snapshot).  Prices are kept to PRICE_DECIMALS decimals; ticks /
+# PRICE_SCALE gives back the same float the order was placed with.
+#
+# Each BookSide keeps a dict {ticks: OrderedDict(order_id → order)} (one
+# FIFO per price level) plus a heap of the level ticks.  Emptied levels
+# are dropped from the dict straight away and lazily from the heap.  All
+# books share `order_index` (order_id → resting order), which is how
+# amend / cancel find an order without scanning – and why an id can rest
+# only once (add() refuses one that is already there):
+#   add        O(log L)   (new level)  /  O(1)  (existing level)
+#   best       O(1)       amortised
+#   pop_best   O(1)       amortised
+#   fill       O(1)       amortised
+#   remove     O(1)       (+ occasional heap compaction)
+# Sides also keep the total quantity per level (`depth`) and the set of
+# levels touched since the engine last looked (`changed`), which is
+# what the L2 depth feed is built from.
+#
+# Every mutation bumps the side's `version`, so OrderBook.version changes
+# whenever the book does; serialized snapshots are cached against it (see
+# snapshot_json) and double as HTTP ETags.
+import heapq, json, os, sys, threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List
 
-# { "AAPL": {"buy": deque([...]), "sell": deque([...])}, ... }
-order_books = defaultdict(lambda: {"buy": deque(), "sell": deque()})
+from services.log import get_logger
 
-def add_order(symbol: str, side: str, order: dict):
-    order_books[symbol][side].append(order)
+log = get_logger("book")
+
+PRICE_DECIMALS = int(os.getenv("PRICE_DECIMALS", "4"))        # tick = 10^-decimals
+PRICE_SCALE    = 10 ** PRICE_DECIMALS
+
+def to_ticks(price: float) -> int:
+    return round(price * PRICE_SCALE)
+
+
+class Order:
+    """One resting order; the book's own record, never sent out as-is."""
+    __slots__ = ("order_id", "user_id", "symbol", "side", "ticks", "quantity")
+
+    def __init__(self, order_id: int, user_id: int, symbol: str, side: str,
+                 ticks: int, quantity: int):
+        self.order_id = order_id
+        self.user_id  = user_id
+        self.symbol   = symbol
+        self.side     = side
+        self.ticks    = ticks
+        self.quantity = quantity
+
+    @classmethod
+    def from_msg(cls, msg: dict) -> "Order":
+        """From a "new" order message (API / journal shape)."""
+        return cls(msg["order_id"], msg["user_id"],
+                   sys.intern(msg["stock_symbol"].upper()), sys.intern(msg["order_type"]),
+                   round(msg["price"] * PRICE_SCALE), msg["quantity"])
+
+    @property
+    def price(self) -> float:
+        return self.ticks / PRICE_SCALE
+
+    def as_dict(self) -> dict:
+        return {
+            "order_id":     self.order_id,
+            "user_id":      self.user_id,
+            "stock_symbol": self.symbol,
+            "order_type":   self.side,
+            "price":        self.ticks / PRICE_SCALE,
+            "quantity":     self.quantity,
+        }
+
+    def __repr__(self) -> str:
+        return (f"Order(#{self.order_id} u{self.user_id} {self.side} {self.symbol} "
+                f"{self.quantity} @ {self.price})")
+
+
+Level = OrderedDict            # order_id → Order, insertion (time) order
+
+# order_id → resting Order (which carries symbol, side and ticks)
+order_index: Dict[int, Order] = {}
+
+# the engine thread holds this while it applies a message; other threads
+# take it to read a consistent view of a book
+book_lock = threading.Lock()
+
+BOOK_CACHE_SIZE = int(os.getenv("BOOK_CACHE_SIZE", "256"))   # serialized snapshots kept
+
+
+class BookSide:
+    """One side of a symbol's book: sorted price levels, FIFO inside each."""
+
+    def __init__(self, side: str):
+        self.side   = side                        # "buy" / "sell"
+        self.levels: Dict[int, Level] = {}        # ticks → FIFO
+        self.depth:  Dict[int, int]   = {}        # ticks → total resting qty
+        self.changed: set[int]        = set()     # ticks touched, see depth.py
+        self.version = 0                          # bumped on every mutation
+        self._heap:  List[int] = []               # bids stored negated
+
+    # heap key – negating is its own inverse, so it also maps key → ticks
+    def _key(self, ticks: int) -> int:
+        return -ticks if self.side == "buy" else ticks
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.levels.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.levels)
+
+    def __iter__(self) -> Iterator[Order]:
+        """Resting orders in priority order (best price first, then FIFO)."""
+        for px in self.ticks():
+            yield from self.levels[px].values()
+
+    def ticks(self) -> List[int]:
+        return sorted(self.levels, reverse=(self.side == "buy"))
+
+    def top_ticks(self, n: int) -> List[int]:
+        """
+        The n best levels, best first.  Walks the heap best-first
+        (children of a popped node are the only new candidates), so it is
+        O(n log n) however deep the book is.
+        """
+        heap, out, seen = self._heap, [], set()
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(out) < n:
+            key, i = heapq.heappop(frontier)
+            px = self._key(key)
+            if px in self.levels and px not in seen:   # skip stale / duplicate keys
+                seen.add(px)
+                out.append(px)
+            for c in (2 * i + 1, 2 * i + 2):
+                if c < len(heap):
+                    heapq.heappush(frontier, (heap[c], c))
+        return out
+
+    def view(self, depth: int | None = None, agg: str = "order") -> list:
+        """
+        The `depth` best levels (all if None), best first: the resting
+        orders as dicts for agg="order", [price, qty, orders] per level
+        for agg="level".
+        """
+        ticks = self.top_ticks(depth) if depth else self.ticks()
+        if agg == "level":
+            return [[px / PRICE_SCALE, self.depth[px], len(self.levels[px])] for px in ticks]
+        return [o.as_dict() for px in ticks for o in self.levels[px].values()]
+
+    def best_tick(self) -> int | None:
+        heap = self._heap
+        while heap:
+            px = self._key(heap[0])
+            if px in self.levels:
+                return px
+            heapq.heappop(heap)                   # stale – level emptied
+        return None
+
+    def best_price(self) -> float | None:
+        px = self.best_tick()
+        return px / PRICE_SCALE if px is not None else None
+
+    def best(self) -> Order | None:
+        px = self.best_tick()
+        return next(iter(self.levels[px].values())) if px is not None else None
+
+    def add(self, order: Order) -> bool:
+        """Rest an order; False (and nothing changes) if its id already rests."""
+        if order.order_id in order_index:
+            log.warning("[BOOK] order #%s already resting – duplicate %r ignored",
+                        order.order_id, order)
+            return False
+        px    = order.ticks
+        level = self.levels.get(px)
+        if level is None:
+            level = self.levels[px] = Level()
+            heapq.heappush(self._heap, self._key(px))
+        level[order.order_id]       = order
+        order_index[order.order_id] = order
+        self.depth[px] = self.depth.get(px, 0) + order.quantity
+        self.changed.add(px)
+        self.version += 1
+        return True
+
+    def pop_best(self) -> Order | None:
+        px = self.best_tick()
+        if px is None:
+            return None
+        level = self.levels[px]
+        _, order = level.popitem(last=False)
+        order_index.pop(order.order_id, None)
+        self._shrink_level(px, order.quantity)
+        return order
+
+    def fill(self, order: Order, qty: int):
+        """Take `qty` off a resting order (the best one when matching)."""
+        order.quantity -= qty
+        if order.quantity == 0:
+            del self.levels[order.ticks][order.order_id]
+            order_index.pop(order.order_id, None)
+        self._shrink_level(order.ticks, qty)
+
+    def resize(self, order: Order, qty: int):
+        """Change a resting order's size in place (keeps its priority)."""
+        self.depth[order.ticks] += qty - order.quantity
+        self.changed.add(order.ticks)
+        self.version += 1
+        order.quantity = qty
+
+    def remove(self, order: Order):
+        px    = order.ticks
+        level = self.levels[px]
+        del level[order.order_id]
+        order_index.pop(order.order_id, None)
+        self._shrink_level(px, order.quantity)
+        if px not in self.levels:
+            self._compact()
+
+    def _shrink_level(self, px: int, qty: int):
+        self.changed.add(px)
+        self.version += 1
+        if self.levels[px]:
+            self.depth[px] -= qty
+        else:
+            del self.levels[px]
+            del self.depth[px]
+
+    def _compact(self):
+        # cancels far from the top leave stale heap keys behind; rebuild
+        # once they outnumber the live levels so the heap stays bounded
+        if len(self._heap) > 2 * len(self.levels) + 64:
+            self._heap = [self._key(px) for px in self.levels]
+            heapq.heapify(self._heap)
+
+
+class OrderBook:
+    """Both sides of one symbol."""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.buy    = BookSide("buy")
+        self.sell   = BookSide("sell")
+
+    def __getitem__(self, side: str) -> BookSide:
+        return self.buy if side == "buy" else self.sell
+
+    @property
+    def version(self) -> int:
+        return self.buy.version + self.sell.version
+
+    def snapshot(self, depth: int | None = None, agg: str = "order") -> dict:
+        return {"buy": self.buy.view(depth, agg), "sell": self.sell.view(depth, agg)}
+
+
+class _Books(dict):
+    def __missing__(self, symbol: str) -> OrderBook:
+        book = self[symbol] = OrderBook(symbol)
+        return book
+
+
+# { "AAPL": OrderBook("AAPL"), ... }
+order_books: Dict[str, OrderBook] = _Books()
+
+def find_order(order_id: int) -> Order | None:
+    """Resting order with that id, or None (filled / cancelled / unknown)."""
+    return order_index.get(order_id)
+
+def add_order(symbol: str, side: str, order: Order) -> bool:
+    return order_books[symbol][side].add(order)
 
 def pop_best(symbol: str, side: str):
-    """Return first order in the deque or None."""
-    if order_books[symbol][side]:
-        return order_books[symbol][side][0]
-    return None
+    """Return the best-priced, oldest order on that side or None."""
+    return order_books[symbol][side].best()
 
 def remove_first(symbol: str, side: str):
-    if order_books[symbol][side]:
-        order_books[symbol][side].popleft()
+    order_books[symbol][side].pop_best()
+
+def version(symbol: str | None = None) -> int:
+    """
+    Version of one book (0 if it doesn't exist yet) or of all of them –
+    versions only grow, so the sum changes whenever any book does.
+    """
+    if symbol:
+        book = order_books.get(symbol.upper())
+        return book.version if book else 0
+    return sum(b.version for b in list(order_books.values())) + len(order_books)
 
-def snapshot(symbol: str | None = None):
+def snapshot(symbol: str | None = None, depth: int | None = None, agg: str = "order"):
     """Return a serialisable copy of order-books (or single symbol)."""
     if symbol:
-        book = order_books.get(symbol.upper(), {"buy": [], "sell": []})
+        book = order_books.get(symbol.upper())
         return {
             "symbol": symbol.upper(),
-            "buy": list(book["buy"]),
-            "sell": list(book["sell"]),
+            **(book.snapshot(depth, agg) if book else {"buy": [], "sell": []}),
         }
     # whole book
-    return {
-        sym: {"buy": list(b["buy"]), "sell": list(b["sell"])}
-        for sym, b in order_books.items()
-    }
+    return {sym: b.snapshot(depth, agg) for sym, b in list(order_books.items())}
+
+# (symbol, depth, agg, version) → JSON bytes, least recently used first
+_cache: OrderedDict[tuple, bytes] = OrderedDict()
+_cache_lock = threading.Lock()
+
+def snapshot_json(symbol: str | None = None, depth: int | None = None,
+                  agg: str = "order") -> tuple[int, bytes]:
+    """
+    (version, JSON body) of snapshot(symbol, depth, agg).  Served from
+    cache while the book is unchanged; otherwise built under book_lock.
+    """
+    symbol = symbol.upper() if symbol else None
+    key = (symbol, depth, agg, version(symbol))
+    with _cache_lock:
+        body = _cache.get(key)
+        if body is not None:
+            _cache.move_to_end(key)
+            return key[3], body
+    with book_lock:                               # version + body consistent
+        key  = (symbol, depth, agg, version(symbol))
+        body = json.dumps(snapshot(symbol, depth, agg)).encode()
+    with _cache_lock:
+        _cache[key] = body
+        while len(_cache) > BOOK_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return key[3], body
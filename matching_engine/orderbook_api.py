@@ -1,14 +1,39 @@
-from fastapi import FastAPI
-from matching_engine.order_book import snapshot
+# matching_engine/orderbook_api.py
+# Order-book snapshots over HTTP.
+#   ?depth=N     – only the N best price levels per side
+#   ?agg=level   – [price, qty, orders] per level instead of every order
+# Bodies come pre-serialized from order_book.snapshot_json and carry an
+# ETag of the book version; a poll with a matching If-None-Match gets an
+# empty 304.
+from typing import Literal
+from fastapi import FastAPI, Query, Request, Response
+from matching_engine.order_book import snapshot_json
+
+Agg   = Literal["order", "level"]
+Depth = Query(None, ge=1, description="price levels per side (default: all)")
 
 app = FastAPI(title="Order-Book API")
 
+def book_etag(symbol: str | None, depth: int | None, agg: str, version) -> str:
+    return f'"{(symbol or "*").upper()}-{depth or "all"}-{agg}-{version}"'
+
+def etag_response(request: Request, etag: str, body: bytes) -> Response:
+    """The body, or an empty 304 if the client already holds this ETag."""
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+def book_response(request: Request, symbol: str | None = None,
+                  depth: int | None = None, agg: str = "order") -> Response:
+    version, body = snapshot_json(symbol, depth, agg)
+    return etag_response(request, book_etag(symbol, depth, agg, version), body)
+
 @app.get("/order-book")
-def whole_book():
-    """Full snapshot of all symbols."""
-    return snapshot()
+def whole_book(request: Request, depth: int | None = Depth, agg: Agg = "order"):
+    """Snapshot of all symbols."""
+    return book_response(request, None, depth, agg)
 
 @app.get("/order-book/{symbol}")
-def single_book(symbol: str):
+def single_book(request: Request, symbol: str, depth: int | None = Depth, agg: Agg = "order"):
     """Snapshot for one symbol (upper-case)."""
-    return snapshot(symbol)
+    return book_response(request, symbol, depth, agg)
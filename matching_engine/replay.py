@@ -0,0 +1,184 @@
+# matching_engine/replay.py
+# Replay a recorded order stream through the matching logic – no
+# RabbitMQ, no Postgres – and summarise what came out.
+#
+#   python -m matching_engine.replay capture.ndjson              # as fast as possible
+#   python -m matching_engine.replay capture.ndjson --speed 1    # original pacing
+#   python -m matching_engine.replay orders.csv -o result.json --fills fills.csv
+#   python -m matching_engine.replay journal/                    # snapshot + segments
+#
+# Sources:
+#   .ndjson / .jsonl  one engine message per line, exactly as published –
+#                     what the engine writes with ENGINE_CAPTURE=<file>
+#   .csv              kind,order_id,user_id,stock_symbol,order_type,price,
+#                     quantity[,sent_at]; for an amend, price / quantity are
+#                     the new values (blank = unchanged); kind blank = new
+#   journal dir/.bin  the engine's own journal (older records carry no
+#                     timestamps: those replay at max speed)
+# Messages go through process_new / process_amend / process_cancel in
+# order with fills captured by a MemorySink.  --speed N replays at N×
+# the recorded pace (sent_at gaps); 0 means no pauses at all.
+#
+# The summary – fills, volume / VWAP per symbol, the final books and
+# per-user positions and P/L – comes from services/analytics.py, the same
+# NumPy pass that ranks users on /leaderboard, so it stays cheap for
+# millions of fills.
+import argparse, csv, json, os, time
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from matching_engine import consumer, depth, candles, ticker
+from matching_engine.journal import read_segment, read_snapshot
+from matching_engine.order_book import order_books, order_index, book_lock
+from matching_engine.sinks import MemorySink, make_sink
+from services.analytics import Totals, user_report
+
+PROCESS = {"new": consumer.process_new, "amend": consumer.process_amend,
+           "cancel": consumer.process_cancel}
+
+
+def reset(sink: str = "memory"):
+    """Empty every piece of engine state a run leaves behind; returns the new sink."""
+    order_books.clear()
+    order_index.clear()
+    ticker.tickers.clear()
+    depth.reset()
+    candles.reset()
+    consumer.journal    = None
+    consumer.recent.clear()
+    consumer.rejected.clear()
+    consumer.ledger     = None
+    consumer.trade_sink = make_sink(sink)
+    return consumer.trade_sink
+
+# ─────────────────────────── loading ────────────────────────────
+def _ndjson(path: str) -> Iterator[dict]:
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _num(v: str, cast):
+    return cast(v) if v not in ("", None) else None
+
+def _csv(path: str) -> Iterator[dict]:
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            kind = row.get("kind") or "new"
+            msg  = {"kind": kind, "order_id": int(row["order_id"]), "user_id": int(row["user_id"])}
+            price, qty = _num(row.get("price"), float), _num(row.get("quantity"), int)
+            if kind == "new":
+                msg.update(stock_symbol=row["stock_symbol"], order_type=row["order_type"],
+                           price=price, quantity=qty)
+            elif kind == "amend":
+                msg["fields"] = {k: v for k, v in (("price", price), ("quantity", qty)) if v is not None}
+            if row.get("sent_at"):
+                msg["sent_at"] = float(row["sent_at"])
+            yield msg
+
+def _journal(path: str) -> Iterator[dict]:
+    if os.path.isdir(path):
+        snap = os.path.join(path, "snapshot.bin")
+        if os.path.exists(snap):                      # resting orders first
+            yield from read_snapshot(snap)[2]
+        files = sorted(os.path.join(path, n) for n in os.listdir(path)
+                       if n.startswith("journal-") and n.endswith(".bin"))
+    else:
+        files = [path]
+    for fp in files:
+        yield from read_segment(fp)
+
+def load(path: str, fmt: str | None = None) -> list[dict]:
+    """Read a recorded stream; the format comes from the extension unless given."""
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = ("journal" if os.path.isdir(path) or ext == ".bin" else
+               "csv" if ext == ".csv" else "ndjson")
+    readers = {"ndjson": _ndjson, "csv": _csv, "journal": _journal}
+    if fmt not in readers:
+        raise ValueError(f"format must be one of {', '.join(readers)}, not {fmt!r}")
+    return list(readers[fmt](path))
+
+# ─────────────────────────── replaying ──────────────────────────
+def replay(messages: Iterable[dict], speed: float = 0.0) -> dict:
+    """
+    Feed the messages through the matching logic on fresh books.  Returns
+    the sink's fills, which message produced each one and the timing.
+    """
+    sink = reset("memory")
+    fill_msg: list[int] = []                          # fills[i] came from message fill_msg[i]
+    t0 = wall0 = None
+    started = time.perf_counter()
+    n = 0
+    for n, msg in enumerate(messages, 1):
+        sent = msg.get("sent_at")
+        if speed > 0 and sent is not None:
+            if t0 is None:
+                t0, wall0 = sent, time.perf_counter()
+            ahead = wall0 + (sent - t0) / speed - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+        before = sink.count
+        with book_lock:
+            PROCESS[msg.get("kind") or "new"](msg)
+        fill_msg.extend([n - 1] * (sink.count - before))
+    return {"messages": n, "seconds": time.perf_counter() - started,
+            "sink": sink, "fill_msg": np.asarray(fill_msg, dtype=np.int64)}
+
+# ─────────────────────────── analytics ──────────────────────────
+def totals(sink: MemorySink) -> Totals:
+    """The sink's fills folded into per-(user, symbol) totals."""
+    t = Totals()
+    t.add_rows(sink.trades)
+    return t
+
+def summarize(result: dict, levels: int = 10) -> dict:
+    t = totals(result["sink"])
+    return {
+        "messages":     result["messages"],
+        "seconds":      round(result["seconds"], 4),
+        "msgs_per_sec": round(result["messages"] / result["seconds"]) if result["seconds"] else None,
+        "fills":        t.trades,
+        "resting":      len(order_index),
+        "symbols":      t.symbol_stats(),
+        "books":        {sym: b.snapshot(levels, "level") for sym, b in order_books.items() if b.buy or b.sell},
+        "users":        user_report(t),
+    }
+
+def write_fills(path: str, result: dict):
+    """The fills as CSV, each with the index of the message that caused it."""
+    with open(path, "w", newline="") as fh:
+        w = csv.writer(fh)
+        w.writerow(["message", "buyer_id", "seller_id", "stock_symbol", "price", "quantity"])
+        for i, t in zip(result["fill_msg"].tolist(), result["sink"].trades):
+            w.writerow([i, *t])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay a recorded order stream through the engine")
+    ap.add_argument("source", help="NDJSON / CSV file or a journal directory / segment")
+    ap.add_argument("--format", choices=("ndjson", "csv", "journal"), help="default: from the extension")
+    ap.add_argument("--speed", type=float, default=0.0,
+                    help="N× the recorded pace (needs sent_at); 0 = as fast as possible")
+    ap.add_argument("--levels", type=int, default=10, help="book levels per side in the summary")
+    ap.add_argument("-o", "--out", help="write the summary as JSON here (default: stdout)")
+    ap.add_argument("--fills", help="also write every fill as CSV here")
+    args = ap.parse_args(argv)
+
+    result  = replay(load(args.source, args.format), args.speed)
+    summary = summarize(result, args.levels)
+    if args.fills:
+        write_fills(args.fills, result)
+    text = json.dumps(summary, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text)
+        print(f"[REPLAY] {summary['messages']:,} messages, {summary['fills']:,} fills in "
+              f"{summary['seconds']} s → {args.out}")
+    else:
+        print(text)
+    return summary
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# matching_engine/risk.py
+# Pre-trade risk checks against an in-memory ledger, so the engine can
+# refuse an order that would overdraw a user without a DB read.
+#
+# Per user the ledger keeps
+#   cash      – balances.cash as of the last fill the engine matched
+#   reserved  – cash locked by resting buys (Σ limit ticks × qty)
+#   shares    – net position per symbol (positions.buy_qty − sell_qty)
+#   held      – shares locked by resting sells
+# ENGINE_RISK picks what is enforced:
+#   off   – nothing, no ledger
+#   cash  – a buy's limit notional must fit in cash − reserved (default)
+#   full  – and a sell must fit in shares − held (no short selling)
+# In every mode an order or amend whose quantity or price isn't positive
+# is refused: a negative buy would "reserve" negative cash and overdraw
+# the seller it crosses.  An order reserves on entry; each fill releases
+# its share of the reservation and moves cash at the trade price, so a
+# buy that crosses at a better price than its limit never stays
+# over-reserved.
+#
+# The ledger is seeded from Postgres after journal recovery (replayed
+# fills are already in balances / positions) and from then on only the
+# engine thread changes it, under book_lock.  Changes made straight in
+# the DB (deposits, fixes) reach it through reconcile(), which a
+# background thread runs every RISK_RECONCILE_INTERVAL seconds: it waits
+# for the trade writer to commit everything matched so far, reads
+# balances / positions, and adopts them for each account that had no
+# fill in the meantime, counting the ones that had drifted.
+#
+# The ledger needs one engine: with ENGINE_SHARDS > 1 every shard would
+# check the user's whole cash against only its own reservations, so a
+# user could reserve up to N× their balance.  The engine refuses to start
+# that way (see check_config); run sharded with ENGINE_RISK=off.
+import os, threading
+from typing import Callable, Dict, Iterable
+
+from sqlalchemy import select
+
+from db.database import SessionLocal
+from matching_engine.order_book import Order, PRICE_SCALE, book_lock
+from models.balance import Balance
+from models.position import Position
+from models.user import User          # noqa: F401 – resolves Balance.user
+from services.log import get_logger
+from services.metrics import Counter
+
+log = get_logger("risk")
+
+ENGINE_RISK             = os.getenv("ENGINE_RISK", "cash")                   # off / cash / full
+RISK_RECONCILE_INTERVAL = float(os.getenv("RISK_RECONCILE_INTERVAL", "30"))  # seconds
+
+REJECTS = Counter("engine_risk_rejects_total", "Orders / amends refused by the risk checks", ["reason"])
+DRIFT   = Counter("engine_risk_drift_total", "Ledger accounts corrected by reconciliation")
+_REFUSED = {r: REJECTS.child(reason=r) for r in ("invalid order", "insufficient cash", "insufficient shares")}
+
+_EPS = 1e-6
+
+
+def check_config(mode: str, shards: int) -> str | None:
+    """None if `mode` can be enforced with `shards` engine shards, else why not."""
+    if mode not in ("off", "cash", "full"):
+        return f"ENGINE_RISK must be off, cash or full, not {mode!r}"
+    if mode != "off" and shards > 1:
+        return (f"ENGINE_RISK={mode} needs ENGINE_SHARDS=1: each of the {shards} shards would "
+                f"check the user's whole cash against only its own reservations, letting a "
+                f"user reserve up to {shards}x their balance – set ENGINE_RISK=off to shard")
+    return None
+
+
+class Account:
+    __slots__ = ("cash", "reserved", "shares", "held", "fills")
+
+    def __init__(self, cash: float = 0.0, shares: Dict[str, int] | None = None):
+        self.cash     = cash
+        self.reserved = 0                         # ticks × qty
+        self.shares: Dict[str, int] = shares or {}
+        self.held:   Dict[str, int] = {}
+        self.fills    = 0                         # bumped per fill, see reconcile()
+
+    def as_dict(self) -> dict:
+        return {
+            "cash":      round(self.cash, 2),
+            "reserved":  round(self.reserved / PRICE_SCALE, 2),
+            "available": round(self.cash - self.reserved / PRICE_SCALE, 2),
+            "shares":    {s: q for s, q in self.shares.items() if q},
+            "held":      {s: q for s, q in self.held.items() if q},
+        }
+
+
+def _read_db(owns: Callable[[str], bool], user_id: int | None = None):
+    """({user_id: cash}, {user_id: {symbol: net qty}}) from Postgres."""
+    cash_q = select(Balance.user_id, Balance.cash)
+    pos_q  = (select(Position.user_id, Position.stock_symbol,
+                     Position.buy_qty - Position.sell_qty)
+              .where(Position.buy_qty != Position.sell_qty))
+    if user_id is not None:
+        cash_q = cash_q.where(Balance.user_id == user_id)
+        pos_q  = pos_q.where(Position.user_id == user_id)
+    db = SessionLocal()
+    try:
+        cash   = {uid: c or 0.0 for uid, c in db.execute(cash_q)}
+        shares: Dict[int, Dict[str, int]] = {}
+        for uid, sym, qty in db.execute(pos_q):
+            if owns(sym):
+                shares.setdefault(uid, {})[sym] = qty
+    finally:
+        db.close()
+    return cash, shares
+
+def _load_account(user_id: int, owns: Callable[[str], bool]) -> Account | None:
+    cash, shares = _read_db(owns, user_id)
+    if user_id not in cash:
+        return None
+    return Account(cash[user_id], shares.get(user_id))
+
+
+class Ledger:
+    def __init__(self, mode: str = ENGINE_RISK, owns: Callable[[str], bool] = lambda s: True,
+                 loader: Callable[[int], Account | None] | None = None):
+        self.mode     = mode
+        self.owns     = owns                      # symbol → traded on this shard?
+        self.loader   = loader or (lambda uid: _load_account(uid, owns))
+        self.accounts: Dict[int, Account] = {}
+        self._stop    = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def account(self, user_id: int) -> Account:
+        """The user's account; first sight of a user reads it from the DB."""
+        a = self.accounts.get(user_id)
+        if a is None:
+            try:
+                a = self.loader(user_id)
+            except Exception as e:
+                log.error("[RISK] could not load account %s: %r", user_id, e)
+                a = None
+            a = self.accounts[user_id] = a or Account()
+        return a
+
+    # ---- checks (engine thread; nothing changes) ----------------------
+    def _refuse(self, reason: str) -> str:
+        _REFUSED[reason].inc()
+        return reason
+
+    def check_new(self, msg: dict) -> str | None:
+        """None if a new order fits, else why not."""
+        if not (msg["quantity"] > 0 and msg["price"] > 0):    # NaN fails too
+            return self._refuse("invalid order")
+        a = self.account(msg["user_id"])
+        if msg["order_type"] == "buy":
+            need = round(msg["price"] * PRICE_SCALE) * msg["quantity"]
+            if need > a.cash * PRICE_SCALE - a.reserved + _EPS:
+                return self._refuse("insufficient cash")
+        elif self.mode == "full":
+            sym = msg["stock_symbol"].upper()
+            if msg["quantity"] > a.shares.get(sym, 0) - a.held.get(sym, 0):
+                return self._refuse("insufficient shares")
+        return None
+
+    def check_amend(self, order: Order, ticks: int, qty: int) -> str | None:
+        """Same for resizing / repricing a resting order (its own reservation counts)."""
+        if qty <= 0 or ticks <= 0:
+            return self._refuse("invalid order")
+        a = self.accounts[order.user_id]
+        if order.side == "buy":
+            need = ticks * qty - order.ticks * order.quantity
+            if need > 0 and need > a.cash * PRICE_SCALE - a.reserved + _EPS:
+                return self._refuse("insufficient cash")
+        elif self.mode == "full":
+            need = qty - order.quantity
+            if need > 0 and need > a.shares.get(order.symbol, 0) - a.held.get(order.symbol, 0):
+                return self._refuse("insufficient shares")
+        return None
+
+    # ---- bookkeeping (engine thread) ----------------------------------
+    def reserve(self, order: Order):
+        a = self.account(order.user_id)
+        if order.side == "buy":
+            a.reserved += order.ticks * order.quantity
+        else:
+            a.held[order.symbol] = a.held.get(order.symbol, 0) + order.quantity
+
+    def release(self, order: Order, qty: int):
+        """`qty` of a resting order no longer needs covering (cancel / shrink)."""
+        a = self.accounts[order.user_id]
+        if order.side == "buy":
+            a.reserved -= order.ticks * qty
+        else:
+            a.held[order.symbol] -= qty
+
+    def fill(self, buy: Order, sell: Order, ticks: int, qty: int):
+        sym   = buy.symbol
+        value = ticks * qty / PRICE_SCALE
+        b, s  = self.accounts[buy.user_id], self.accounts[sell.user_id]
+        b.cash     -= value
+        b.reserved -= buy.ticks * qty
+        b.shares[sym] = b.shares.get(sym, 0) + qty
+        b.fills    += 1
+        s.cash     += value
+        s.held[sym] -= qty
+        s.shares[sym] = s.shares.get(sym, 0) - qty
+        s.fills    += 1
+
+    # ---- Postgres -----------------------------------------------------
+    def seed(self, resting: Iterable[Order]) -> int:
+        """Load every account, then reserve for the books as recovered."""
+        cash, shares = _read_db(self.owns)
+        self.accounts = {uid: Account(c, shares.get(uid)) for uid, c in cash.items()}
+        for o in resting:
+            self.reserve(o)
+        return len(self.accounts)
+
+    def reconcile(self, flush: Callable[[], bool]) -> int:
+        """
+        Adopt balances / positions for every account with no fill since
+        the trade writer was last flushed; returns how many had drifted.
+        """
+        with book_lock:
+            marks = {uid: a.fills for uid, a in self.accounts.items()}
+        if not flush():                           # writer behind – next round
+            return 0
+        cash, shares = _read_db(self.owns)
+        drifted = 0
+        with book_lock:
+            for uid, c in cash.items():
+                a = self.accounts.get(uid)
+                if a is None:                     # registered since the last read
+                    self.accounts[uid] = Account(c, shares.get(uid))
+                    continue
+                if a.fills != marks.get(uid):     # matched meanwhile – DB may lag
+                    continue
+                pos = shares.get(uid, {})
+                if abs(a.cash - c) > _EPS or {s: q for s, q in a.shares.items() if q} != pos:
+                    drifted += 1
+                    log.warning("[RISK] account %s drifted: cash %s → %s", uid, a.cash, c)
+                a.cash, a.shares = c, dict(pos)
+        if drifted:
+            DRIFT.inc(drifted)
+        return drifted
+
+    # ---- reconciliation thread ----------------------------------------
+    def start(self, flush: Callable[[], bool], interval: float = RISK_RECONCILE_INTERVAL):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(flush, interval),
+                                            name="risk-reconcile", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, flush, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reconcile(flush)
+            except Exception as e:
+                log.error("[RISK] reconciliation failed: %r", e)
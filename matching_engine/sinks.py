@@ -0,0 +1,72 @@
+# matching_engine/sinks.py
+# Where the engine sends its fills.  ENGINE_TRADE_SINK picks one:
+#   db      – services.trade_logger (batched Postgres writes; the default)
+#   memory  – keep them in a list (benchmarks, replays, tests by hand)
+#   null    – count and drop them
+# A sink has record(buyer_id, seller_id, stock_symbol, price, quantity)
+# plus start / flush / close, which the consumer calls around batches.
+import os
+
+ENGINE_TRADE_SINK = os.getenv("ENGINE_TRADE_SINK", "db")
+
+
+class NullSink:
+    def __init__(self):
+        self.count = 0
+
+    def record(self, buyer_id, seller_id, stock_symbol, price, quantity):
+        self.count += 1
+
+    def start(self):
+        pass
+
+    def flush(self, timeout: float | None = None) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+class MemorySink(NullSink):
+    """Fills as (buyer_id, seller_id, stock_symbol, price, quantity) tuples."""
+
+    def __init__(self):
+        super().__init__()
+        self.trades: list[tuple] = []
+
+    def record(self, buyer_id, seller_id, stock_symbol, price, quantity):
+        self.count += 1
+        self.trades.append((buyer_id, seller_id, stock_symbol, price, quantity))
+
+    def clear(self):
+        self.count = 0
+        self.trades.clear()
+
+
+class DbSink:
+    """The group-commit trade writer; flush() waits until fills are committed."""
+
+    def __init__(self):
+        from services.trade_logger import trade_writer     # pulls in the DB layer
+        self.writer = trade_writer
+
+    def record(self, buyer_id, seller_id, stock_symbol, price, quantity):
+        self.writer.submit(buyer_id, seller_id, stock_symbol, price, quantity)
+
+    def start(self):
+        self.writer.start()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        return self.writer.flush(timeout)
+
+    def close(self):
+        self.writer.close()
+
+
+SINKS = {"db": DbSink, "memory": MemorySink, "null": NullSink}
+
+def make_sink(name: str = ENGINE_TRADE_SINK):
+    try:
+        return SINKS[name]()
+    except KeyError:
+        raise ValueError(f"ENGINE_TRADE_SINK must be one of {', '.join(SINKS)}, not {name!r}")
@@ -0,0 +1,75 @@
+# matching_engine/ticker.py
+# Per-symbol ticker kept by the engine thread:
+#   last / last_qty      – updated on every fill
+#   bid / ask            – best prices after every book change
+#   high / low / volume  – for the current UTC day (since engine start)
+# The engine's /ticker endpoints serve it; the API reads it from there
+# (services/market_data.py) instead of querying the trades table.
+from datetime import datetime, UTC
+from typing import Dict
+
+
+class Ticker:
+    __slots__ = ("symbol", "last", "last_qty", "bid", "ask",
+                 "high", "low", "volume", "day", "updated")
+
+    def __init__(self, symbol: str):
+        self.symbol   = symbol
+        self.last     = None
+        self.last_qty = 0
+        self.bid      = None
+        self.ask      = None
+        self.high     = None
+        self.low      = None
+        self.volume   = 0
+        self.day      = None
+        self.updated  = None
+
+    def fill(self, price: float, qty: int):
+        now = datetime.now(UTC)
+        if now.date() != self.day:              # new UTC day → reset stats
+            self.day, self.high, self.low, self.volume = now.date(), price, price, 0
+        self.last, self.last_qty = price, qty
+        self.high    = max(self.high, price)
+        self.low     = min(self.low, price)
+        self.volume += qty
+        self.updated = now
+
+    def as_dict(self) -> dict:
+        return {
+            "symbol":   self.symbol,
+            "last":     self.last,
+            "last_qty": self.last_qty,
+            "bid":      self.bid,
+            "ask":      self.ask,
+            "high":     self.high,
+            "low":      self.low,
+            "volume":   self.volume,
+            "updated":  self.updated.isoformat() if self.updated else None,
+        }
+
+
+class _Tickers(dict):
+    def __missing__(self, symbol: str) -> Ticker:
+        t = self[symbol] = Ticker(symbol)
+        return t
+
+
+tickers: Dict[str, Ticker] = _Tickers()
+
+def on_fill(symbol: str, price: float, qty: int):
+    tickers[symbol].fill(price, qty)
+
+def on_book(symbol: str, bid: float | None, ask: float | None):
+    t = tickers[symbol]
+    t.bid, t.ask = bid, ask
+
+def seed_last(symbol: str, price: float):
+    """Last price from history (engine start) – no day stats."""
+    tickers[symbol].last = price
+
+def snapshot(symbol: str | None = None):
+    if symbol:
+        t = tickers.get(symbol.upper())
+        return t.as_dict() if t else Ticker(symbol.upper()).as_dict()
+    return {s: t.as_dict() for s, t in list(tickers.items())}
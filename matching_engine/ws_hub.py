@@ -1,22 +1,205 @@
-from typing import List
+# matching_engine/ws_hub.py
+# WebSocket fan-out.
+#
+# Every client gets a bounded outbound queue drained by its own sender
+# task, so broadcast() never awaits a socket: a slow client only fills its
+# own queue.  When that queue is full the WS_SLOW_POLICY applies:
+#   drop        – discard the client's oldest queued message
+#   disconnect  – close the client (code 1013, "try again later")
+# Payloads are JSON-encoded once per message, not once per client.
+#
+# Clients sit on a channel ("trades" or "depth") and may narrow what
+# they get with
+#   {"action": "subscribe",   "symbols": ["AAPL", "MSFT"]}
+#   {"action": "unsubscribe", "symbols": ["MSFT"]}
+# Trade clients receive every symbol until they subscribe to something;
+# depth clients receive nothing until they do.  Depth deltas carry a seq,
+# so a depth client that lost messages to the drop policy sees a gap and
+# resubscribes for a fresh snapshot.
+#
+# The engine thread never touches the loop directly: it post()s to the
+# Outbox, a bounded deque drained on the event loop once per conflation
+# window (WS_CONFLATE_WINDOW seconds; 0 = next loop iteration).  A drain
+# merges the trade batches queued for a symbol into one message
+#   {"type": "trades", "symbol": "AAPL",
+#    "trades": [{"price": 101.5, "quantity": 20, "timestamp": "…"}, …]}
+# so a sweep through 500 resting orders is one cross-thread hop and one
+# write per client rather than 500.
+import asyncio, json, os, time
+from collections import deque
+from typing import Dict
 from fastapi import WebSocket
+from services.metrics import Counter, Gauge, STAGE_LATENCY
 
-_clients: List[WebSocket] = []
+WS_QUEUE_SIZE  = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop")        # drop / disconnect
+WS_CONFLATE_WINDOW = float(os.getenv("WS_CONFLATE_WINDOW", "0"))   # seconds
+WS_OUTBOX_SIZE     = int(os.getenv("WS_OUTBOX_SIZE", "65536"))     # queued messages
 
-async def register(ws: WebSocket):
-    await ws.accept()
-    _clients.append(ws)
 
-def unregister(ws: WebSocket):
-    if ws in _clients:
-        _clients.remove(ws)
+class Client:
+    def __init__(self, ws: WebSocket, channel: str):
+        self.ws      = ws
+        self.channel = channel
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        # None = everything
+        self.symbols: set[str] | None = None if channel == "trades" else set()
+        self.dropped = 0
+        self.task    = asyncio.create_task(self._sender())
 
-async def broadcast(data: dict):
-    to_drop = []
-    for ws in _clients:
+    def wants(self, symbol: str | None) -> bool:
+        return self.symbols is None or symbol is None or symbol in self.symbols
+
+    def offer(self, text: str) -> bool:
+        """Queue without waiting; False means the client must be dropped."""
         try:
-            await ws.send_json(data)
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            if WS_SLOW_POLICY == "disconnect":
+                return False
+            self.queue.get_nowait()                          # drop oldest
+            self.queue.put_nowait(text)
+            self.dropped += 1
+            return True
+
+    async def _sender(self):
+        try:
+            while True:
+                await self.ws.send_text(await self.queue.get())
+        except asyncio.CancelledError:
+            raise
         except Exception:
-            to_drop.append(ws)
-    for ws in to_drop:
-        unregister(ws)
+            unregister(self.ws)
+
+
+_clients: Dict[WebSocket, Client] = {}
+
+WS_SENT = Counter("ws_messages_total", "Messages queued to WebSocket clients", ["channel"])
+_BROADCAST = STAGE_LATENCY.child(stage="broadcast")
+Gauge("ws_clients", "Connected WebSocket clients", ["channel"],
+      fn=lambda: {ch: sum(c.channel == ch for c in list(_clients.values()))
+                  for ch in ("trades", "depth")})
+Gauge("ws_dropped_messages", "Messages dropped for slow clients or a full outbox",
+      fn=lambda: sum(c.dropped for c in list(_clients.values())) + outbox.dropped)
+_watched: Dict[str, frozenset] = {}          # channel → symbols subscribed to
+
+def watched(channel: str) -> frozenset:
+    """Symbols at least one client of `channel` has subscribed to."""
+    return _watched.get(channel, frozenset())
+
+def _rewatch(channel: str):
+    syms = set()
+    for c in list(_clients.values()):
+        if c.channel == channel and c.symbols:
+            syms |= c.symbols
+    _watched[channel] = frozenset(syms)    # swapped whole – readable from any thread
+
+async def register(ws: WebSocket, channel: str = "trades") -> Client:
+    await ws.accept()
+    client = _clients[ws] = Client(ws, channel)
+    return client
+
+def unregister(ws: WebSocket):
+    client = _clients.pop(ws, None)
+    if client:
+        _rewatch(client.channel)
+        if client.task is not asyncio.current_task():
+            client.task.cancel()
+
+async def _kick(ws: WebSocket):
+    unregister(ws)
+    try:
+        await ws.close(code=1013)
+    except Exception:
+        pass
+
+def handle_message(ws: WebSocket, text: str) -> set[str]:
+    """Apply a subscribe / unsubscribe request; returns symbols just subscribed."""
+    client = _clients.get(ws)
+    try:
+        msg = json.loads(text)
+        action  = msg.get("action")
+        symbols = {s.upper() for s in msg.get("symbols", [])}
+    except (ValueError, AttributeError, TypeError):
+        return set()                                         # ignore junk / pings
+    if client is None:
+        return set()
+    if action == "subscribe":
+        client.symbols = (client.symbols or set()) | symbols
+        _rewatch(client.channel)
+        return symbols
+    if action == "unsubscribe" and client.symbols is not None:
+        client.symbols -= symbols
+        _rewatch(client.channel)
+    return set()
+
+def broadcast(data: dict, channel: str = "trades"):
+    """Offer one message to every interested client (event-loop thread only)."""
+    symbol = data.get("symbol")
+    text   = json.dumps(data)                                # once per message
+    sent   = 0
+    for ws, client in list(_clients.items()):
+        if client.channel == channel and client.wants(symbol):
+            if client.offer(text):
+                sent += 1
+            else:
+                asyncio.create_task(_kick(ws))
+    if sent:
+        WS_SENT.inc(sent, channel=channel)
+
+
+class Outbox:
+    """
+    Engine thread → event loop hand-off.  deque append / popleft are
+    atomic, so post() takes no lock; it only schedules a drain when none
+    is pending.  The flag is cleared before the drain empties the deque,
+    so anything appended after that schedules the next one.
+    """
+
+    def __init__(self, size: int = WS_OUTBOX_SIZE, window: float = WS_CONFLATE_WINDOW):
+        self.items: deque[tuple[str, dict, float]] = deque(maxlen=size)
+        self.window  = window
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.dropped = 0                          # oldest lost to a full deque
+        self._scheduled = False
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def post(self, data: dict, channel: str = "trades"):
+        """Queue a message for broadcast (any thread; no-op until bound)."""
+        if self.loop is None:
+            return
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+        self.items.append((channel, data, time.perf_counter()))
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon_threadsafe(self._arm)
+
+    def _arm(self):
+        if self.window > 0:
+            self.loop.call_later(self.window, self._drain)
+        else:
+            self._drain()
+
+    def _drain(self):
+        self._scheduled = False
+        out, trades = [], {}                      # symbol → merged trade batch
+        now = time.perf_counter()
+        while self.items:
+            channel, data, posted = self.items.popleft()
+            _BROADCAST.observe(now - posted)
+            if channel == "trades" and data.get("type") == "trades":
+                merged = trades.get(data["symbol"])
+                if merged is not None:
+                    merged["trades"].extend(data["trades"])
+                    continue
+                data = trades[data["symbol"]] = {**data, "trades": list(data["trades"])}
+            out.append((channel, data))
+        for channel, data in out:
+            broadcast(data, channel)
+
+
+outbox = Outbox()
@@ -0,0 +1,24 @@
+# models/candle.py
+from sqlalchemy import Column, DateTime, Float, Integer, String, UniqueConstraint
+from db.database import Base
+
+class Candle(Base):
+    """
+    One closed OHLCV bar.  Written in bulk by the engine's candle writer
+    and by `python -m services.candles backfill`.
+    """
+    __tablename__ = "candles"
+    __table_args__ = (
+        UniqueConstraint("stock_symbol", "interval", "start", name="uq_candles_symbol_interval_start"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    stock_symbol = Column(String, nullable=False)
+    interval = Column(String, nullable=False)                 # "1s", "1m", "5m", "1h" …
+    start = Column(DateTime, nullable=False)                  # bar open, UTC
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    volume = Column(Integer, nullable=False)
+    trades = Column(Integer, nullable=False)
@@ -0,0 +1,21 @@
+# models/position.py
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, UniqueConstraint
+from db.database import Base
+
+class Position(Base):
+    """
+    Running per-user, per-symbol totals, kept up to date by the trade
+    writer.  Everything else (net qty, avg cost, realised P/L) is derived.
+    """
+    __tablename__ = "positions"
+    __table_args__ = (
+        UniqueConstraint("user_id", "stock_symbol", name="uq_positions_user_symbol"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    stock_symbol = Column(String, nullable=False)
+    buy_qty = Column(Integer, default=0, nullable=False)
+    buy_value = Column(Float, default=0.0, nullable=False)     # Σ price·qty bought
+    sell_qty = Column(Integer, default=0, nullable=False)
+    sell_value = Column(Float, default=0.0, nullable=False)    # Σ price·qty sold
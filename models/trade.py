@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from db.database import Base
 from datetime import datetime
@@ -13,3 +13,10 @@ class Trade(Base):
     price = Column(Float)
     quantity = Column(Integer)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+    # newest-first history per symbol / per user, walked by (timestamp, id)
+    __table_args__ = (
+        Index("ix_trades_symbol_ts_id", "stock_symbol", "timestamp", "id"),
+        Index("ix_trades_buyer_ts_id",  "buyer_id",     "timestamp", "id"),
+        Index("ix_trades_seller_ts_id", "seller_id",    "timestamp", "id"),
+    )
@@ -0,0 +1,284 @@
+# services/analytics.py
+# Cross-user P/L, computed with NumPy over the whole trades table.
+#
+# Trades are read in columnar chunks (ANALYTICS_CHUNK rows per fetch from a
+# server-side cursor) and folded into Totals: per (user, symbol) the bought
+# / sold quantity and value – the same four numbers the positions table
+# keeps.  Everything else follows from those in one vectorized pass:
+#   net          bought − sold
+#   avg_cost     average buy price for a long, average sell for a short
+#   realized     closed qty × (avg sell − avg buy)     (as services/portfolio.py)
+#   unrealized   net × (last − avg_cost)
+#   pnl          realized + unrealized  (= sold value − bought value + net × last)
+#   vwap         all the user's fills in the symbol
+# Positions are marked at the engine ticker's last price, or the last
+# trade in Postgres for symbols the engine doesn't know.
+#
+# The Leaderboard behind /leaderboard is recomputed by a background thread
+# every LEADERBOARD_REFRESH seconds and served from memory, so a request
+# never scans trades.  matching_engine/replay.py summarises its fills with
+# the same Totals.
+import os, threading, time
+from datetime import datetime, timezone
+from typing import Iterable, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal
+from models.trade import Trade
+from models.user import User
+from services.log import get_logger
+from services.market_data import last_prices
+from services.metrics import Gauge, Histogram
+
+load_dotenv()
+
+log = get_logger("analytics")
+
+ANALYTICS_CHUNK     = int(os.getenv("ANALYTICS_CHUNK", "50000"))          # rows per fetch
+LEADERBOARD_REFRESH = float(os.getenv("LEADERBOARD_REFRESH", "60"))       # seconds; 0 = first request only
+
+RANKINGS = ("pnl", "realized_pnl", "unrealized_pnl")
+
+_SYM_BITS = 24                                    # key = user_id << 24 | symbol code
+_SYM_MASK = (1 << _SYM_BITS) - 1
+
+REFRESH_SECONDS = Histogram("leaderboard_refresh_seconds", "Time to recompute the leaderboard",
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+class Totals:
+    """Bought / sold quantity and value per (user, symbol), grown a chunk at a time."""
+
+    def __init__(self):
+        self._codes: dict[str, int] = {}          # symbol → code, in order of first sight
+        self.keys   = np.empty(0, np.int64)       # sorted (user, symbol) keys
+        self.sums   = np.empty((4, 0))            # bought qty, bought value, sold qty, sold value
+        self.fills  = np.empty(0, np.int64)       # trades per symbol code
+        self.last   = np.empty(0)                 # latest price per symbol code (order seen)
+        self.trades = 0
+
+    @property
+    def symbols(self) -> list[str]:
+        return list(self._codes)
+
+    def code(self, symbols: Sequence[str]) -> np.ndarray:
+        codes = self._codes
+        return np.fromiter((codes.setdefault(s, len(codes)) for s in symbols),
+                           np.int64, len(symbols))
+
+    def add_rows(self, rows: Sequence[tuple]):
+        """(buyer_id, seller_id, symbol, price, quantity) tuples, oldest first."""
+        if not rows:
+            return
+        buyer, seller, sym, price, qty = zip(*rows)
+        self.add(np.asarray(buyer, np.int64), np.asarray(seller, np.int64), self.code(sym),
+                 np.asarray(price, np.float64), np.asarray(qty, np.float64))
+
+    def add(self, buyer: np.ndarray, seller: np.ndarray, sym: np.ndarray,
+            price: np.ndarray, qty: np.ndarray):
+        n = len(qty)
+        if not n:
+            return
+        value = price * qty
+        zero  = np.zeros(n)
+        # one leg per side of every trade, merged with what came before
+        keys = np.concatenate([self.keys, buyer << _SYM_BITS | sym, seller << _SYM_BITS | sym])
+        legs = np.hstack([self.sums, [np.concatenate([qty, zero]), np.concatenate([value, zero]),
+                                      np.concatenate([zero, qty]), np.concatenate([zero, value])]])
+        self.keys, inv = np.unique(keys, return_inverse=True)
+        self.sums = np.stack([np.bincount(inv, weights=col, minlength=len(self.keys)) for col in legs])
+
+        k = len(self._codes)
+        grow = k - len(self.last)
+        if grow:
+            self.fills = np.concatenate([self.fills, np.zeros(grow, np.int64)])
+            self.last  = np.concatenate([self.last, np.full(grow, np.nan)])
+        self.fills += np.bincount(sym, minlength=k)
+        seen, first = np.unique(sym[::-1], return_index=True)   # each symbol's final trade
+        self.last[seen] = price[::-1][first]
+        self.trades += n
+
+    # ---- vectorized results -------------------------------------------
+    def positions(self, marks: dict[str, float] | None = None) -> dict[str, np.ndarray]:
+        """
+        One entry per (user, symbol) traded.  `marks` overrides the last
+        price per symbol (default: the latest trade added).
+        """
+        last = self.last.copy()
+        for s, px in (marks or {}).items():
+            c = self._codes.get(s)
+            if c is not None:
+                last[c] = px
+        sym = self.keys & _SYM_MASK
+        bq, bv, sq, sv = self.sums
+        net = bq - sq
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_buy  = np.where(bq > 0, bv / bq, np.nan)
+            avg_sell = np.where(sq > 0, sv / sq, np.nan)
+            vwap     = (bv + sv) / (bq + sq)
+        closed   = np.minimum(bq, sq)
+        avg_cost = np.where(net > 0, avg_buy, np.where(net < 0, avg_sell, np.nan))
+        realized = np.where(closed > 0, closed * (avg_sell - avg_buy), 0.0)
+        unreal   = np.where(net != 0, net * (last[sym] - avg_cost), 0.0)
+        return {"user": self.keys >> _SYM_BITS, "sym": sym,
+                "bought": bq, "bought_value": bv, "sold": sq, "sold_value": sv,
+                "net": net, "avg_cost": avg_cost, "vwap": vwap, "last": last[sym],
+                "realized": realized, "unrealized": unreal, "pnl": realized + unreal,
+                "notional": bv + sv}
+
+    def symbol_stats(self) -> dict:
+        """Fills, volume, notional, VWAP and last price per symbol."""
+        if not self.trades:
+            return {}
+        k   = len(self._codes)
+        sym = self.keys & _SYM_MASK
+        volume = np.bincount(sym, weights=self.sums[0], minlength=k)   # buy legs: each trade once
+        value  = np.bincount(sym, weights=self.sums[1], minlength=k)
+        return {s: {"fills": int(self.fills[i]), "volume": int(volume[i]),
+                    "notional": round(float(value[i]), 2),
+                    "vwap": round(float(value[i] / volume[i]), 4),
+                    "last": float(self.last[i])}
+                for s, i in sorted(self._codes.items())}
+
+
+def per_user(pos: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """positions() summed over symbols: one entry per user, ascending ids."""
+    users, u = np.unique(pos["user"], return_inverse=True)
+    out = {"user": users}
+    for col in ("realized", "unrealized", "pnl", "notional"):
+        out[col] = np.bincount(u, weights=pos[col], minlength=len(users))
+    out["open"] = np.bincount(u, weights=pos["net"] != 0, minlength=len(users)).astype(np.int64)
+    return out
+
+def user_report(totals: Totals, marks: dict[str, float] | None = None) -> dict:
+    """{user_id: {positions, realized_pnl, pnl, notional}} – the replay summary."""
+    pos = totals.positions(marks)
+    if not len(pos["user"]):
+        return {}
+    symbols = np.asarray(totals.symbols, dtype=object)
+    users   = per_user(pos)
+    starts  = np.searchsorted(pos["user"], users["user"])      # keys are sorted by user
+    ends    = np.append(starts[1:], len(pos["user"]))
+    return {int(uid): {
+                "positions":    dict(zip(symbols[pos["sym"][a:b]].tolist(),
+                                         pos["net"][a:b].astype(np.int64).tolist())),
+                "realized_pnl": round(float(users["realized"][i]), 2),
+                "pnl":          round(float(users["pnl"][i]), 2),
+                "notional":     round(float(users["notional"][i]), 2)}
+            for i, (uid, a, b) in enumerate(zip(users["user"], starts, ends))}
+
+# ─────────────────────────── Postgres ───────────────────────────
+_TRADE_COLUMNS = select(Trade.buyer_id, Trade.seller_id, Trade.stock_symbol,
+                        Trade.price, Trade.quantity)
+
+def load_trades(db: Session, chunk: int = ANALYTICS_CHUNK) -> Totals:
+    """Fold the whole trades table into Totals, `chunk` rows per fetch."""
+    totals = Totals()
+    # Core, not ORM, rows: the ORM layer costs more than the fetch itself
+    result = db.connection().execute(_TRADE_COLUMNS.execution_options(yield_per=chunk))
+    for rows in result.partitions():
+        totals.add_rows(rows)
+    return totals
+
+def _db_last_prices(db: Session, symbols: Iterable[str]) -> dict[str, float]:
+    """Latest trade price per symbol – DISTINCT ON over ix_trades_symbol_ts_id."""
+    rows = db.execute(
+        select(Trade.stock_symbol, Trade.price)
+          .where(Trade.stock_symbol.in_(list(symbols)))
+          .distinct(Trade.stock_symbol)
+          .order_by(Trade.stock_symbol, Trade.timestamp.desc(), Trade.id.desc())
+    )
+    return {sym: px for sym, px in rows}
+
+def marks_for(db: Session, symbols: list[str]) -> dict[str, float]:
+    """Engine ticker's last price per symbol, Postgres for the rest."""
+    marks   = last_prices(symbols)
+    missing = [s for s in symbols if s not in marks]
+    if missing:
+        marks.update(_db_last_prices(db, missing))
+    return marks
+
+# ─────────────────────────── leaderboard ────────────────────────
+class Leaderboard:
+    """Users ranked by P/L, recomputed in the background and read from memory."""
+
+    def __init__(self, interval: float = LEADERBOARD_REFRESH):
+        self.interval = interval
+        self.as_of: datetime | None = None
+        self.trades = 0
+        self.ranked: dict[str, list[dict]] = {}   # ranking → rows, best first
+        self._lock   = threading.Lock()
+        self._stop   = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.as_of is not None
+
+    def refresh(self, if_empty: bool = False):
+        with self._lock:                          # one recompute at a time
+            if if_empty and self.ready:           # the thread got there first
+                return
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                totals = load_trades(db)
+                users  = per_user(totals.positions(marks_for(db, totals.symbols)))
+                names  = {uid: name for uid, name in db.execute(select(User.id, User.username))}
+            finally:
+                db.close()
+
+            ids  = users["user"].tolist()
+            cols = {c: np.round(users[c], 2).tolist() for c in ("realized", "unrealized", "pnl", "notional")}
+            rows = [{"user_id": uid, "username": names.get(uid),
+                     "pnl": cols["pnl"][i], "realized_pnl": cols["realized"][i],
+                     "unrealized_pnl": cols["unrealized"][i], "notional": cols["notional"][i],
+                     "open_positions": int(users["open"][i])}
+                    for i, uid in enumerate(ids)]
+            ranked = {}
+            for by, col in zip(RANKINGS, ("pnl", "realized", "unrealized")):
+                order = np.lexsort((users["user"], -users[col]))   # ties: lower id first
+                ranked[by] = [rows[i] for i in order.tolist()]
+            self.ranked, self.trades = ranked, totals.trades     # swapped whole
+            self.as_of = datetime.now(timezone.utc)
+            took = time.perf_counter() - started
+        REFRESH_SECONDS.observe(took)
+        log.info("[LEADERBOARD] %s users over %s trades ranked in %.3fs", len(rows), totals.trades, took)
+
+    def top(self, by: str = "pnl", limit: int = 100, offset: int = 0) -> list[dict]:
+        rows = self.ranked.get(by, [])[offset:offset + limit]
+        return [{"rank": offset + i, **r} for i, r in enumerate(rows, 1)]
+
+    # ---- refresh thread -----------------------------------------------
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="leaderboard", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                log.error("[LEADERBOARD] refresh failed: %r", e)
+            if self._stop.wait(self.interval):
+                return
+
+
+leaderboard = Leaderboard()
+Gauge("leaderboard_age_seconds", "Seconds since the leaderboard was recomputed",
+      fn=lambda: (datetime.now(timezone.utc) - leaderboard.as_of).total_seconds()
+                 if leaderboard.as_of else 0.0)
@@ -0,0 +1,125 @@
+# services/candles.py
+# OHLCV candles: interval config, bulk persistence and the backfill.
+#
+# The engine aggregates bars as it fills (matching_engine/candles.py) and
+# hands closed ones to save_candles().  A bar that already exists (one
+# that straddled an engine restart) is merged into, not replaced.  The
+# backfill rebuilds everything from the trades table with NumPy:
+#   python -m services.candles backfill [1m 5m …]
+import os
+from datetime import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models.candle import Candle
+from models.trade import Trade
+
+load_dotenv()
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def interval_seconds(name: str) -> int:
+    """"1s" → 1, "5m" → 300, "1h" → 3600 …"""
+    try:
+        n, unit = int(name[:-1]), _UNITS[name[-1]]
+    except (ValueError, KeyError, IndexError):
+        raise ValueError(f"bad candle interval {name!r}")
+    if n <= 0:
+        raise ValueError(f"bad candle interval {name!r}")
+    return n * unit
+
+# name → seconds, in configured order
+CANDLE_INTERVALS = {
+    name: interval_seconds(name)
+    for name in os.getenv("CANDLE_INTERVALS", "1s,1m,5m,1h").replace(" ", "").split(",") if name
+}
+CANDLE_FLUSH_INTERVAL = float(os.getenv("CANDLE_FLUSH_INTERVAL", "1.0"))   # seconds
+
+_table  = Candle.__table__
+_ins    = pg_insert(_table)
+_upsert = _ins.on_conflict_do_update(
+    constraint="uq_candles_symbol_interval_start",
+    set_={
+        "high":   func.greatest(_table.c.high, _ins.excluded.high),
+        "low":    func.least(_table.c.low, _ins.excluded.low),
+        "close":  _ins.excluded.close,
+        "volume": _table.c.volume + _ins.excluded.volume,
+        "trades": _table.c.trades + _ins.excluded.trades,
+    },
+)
+
+def save_candles(db: Session, rows: list[dict]):
+    """Upsert closed bars (dicts with Candle's columns) – one executemany."""
+    if rows:
+        db.execute(_upsert, rows)
+        db.commit()
+
+# ---- backfill ---------------------------------------------------------
+def aggregate(ts: np.ndarray, price: np.ndarray, qty: np.ndarray, seconds: int) -> dict:
+    """
+    OHLCV per bucket for one symbol's trades, already sorted by time.
+    `ts` is epoch seconds; returns column arrays, one entry per bar.
+    """
+    bucket = (ts // seconds).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends   = np.r_[starts[1:], len(ts)]
+    return {
+        "start":  bucket[starts] * seconds,
+        "open":   price[starts],
+        "high":   np.maximum.reduceat(price, starts),
+        "low":    np.minimum.reduceat(price, starts),
+        "close":  price[ends - 1],
+        "volume": np.add.reduceat(qty, starts),
+        "trades": ends - starts,
+    }
+
+def backfill(db: Session, intervals: dict[str, int] = CANDLE_INTERVALS) -> int:
+    """
+    Rebuild the given intervals from the trades table, one symbol at a
+    time (so memory is bounded by the busiest symbol).  Run it with the
+    engine stopped, or bars it closes meanwhile are overwritten.
+    """
+    symbols = db.scalars(select(Trade.stock_symbol).distinct()).all()
+    db.query(Candle).filter(Candle.interval.in_(list(intervals))).delete(synchronize_session=False)
+    total = 0
+    for sym in symbols:
+        rows = db.execute(
+            select(func.extract("epoch", Trade.timestamp), Trade.price, Trade.quantity)
+            .where(Trade.stock_symbol == sym, Trade.timestamp.is_not(None))
+            .order_by(Trade.timestamp, Trade.id)
+        ).all()
+        if not rows:
+            continue
+        ts, price, qty = (np.asarray(c, dtype=float) for c in zip(*rows))
+        out = []
+        for name, seconds in intervals.items():
+            bars = aggregate(ts, price, qty, seconds)
+            out += [
+                {"stock_symbol": sym, "interval": name,
+                 "start":  datetime.utcfromtimestamp(int(s)),
+                 "open":   float(o), "high": float(h), "low": float(l), "close": float(c),
+                 "volume": int(v), "trades": int(n)}
+                for s, o, h, l, c, v, n in zip(*bars.values())
+            ]
+        db.execute(_table.insert(), out)
+        total += len(out)
+    db.commit()
+    return total
+
+if __name__ == "__main__":            # python -m services.candles backfill [1m 5m …]
+    import sys
+    from db.database import Base, SessionLocal, engine
+
+    if sys.argv[1:2] != ["backfill"]:
+        sys.exit("usage: python -m services.candles backfill [interval …]")
+    wanted = {n: interval_seconds(n) for n in sys.argv[2:]} or CANDLE_INTERVALS
+    Base.metadata.create_all(bind=engine, tables=[Candle.__table__])
+    db = SessionLocal()
+    try:
+        print(f"[CANDLES] rebuilt {backfill(db, wanted)} bars from trades")
+    finally:
+        db.close()
@@ -0,0 +1,28 @@
+# services/log.py
+# Non-blocking, level-gated logging for the engine and the API.
+#
+#   log = get_logger("engine")
+#   log.debug("[TRADE] %s %s @ %s", sym, qty, px)   # formatted only if enabled
+#
+# Records go through a QueueHandler, so the calling thread only enqueues;
+# one listener thread formats and writes them to stdout.  LOG_LEVEL
+# (default INFO) gates them: per-order / per-fill lines are DEBUG, so on a
+# busy engine they cost a level check and nothing else.
+import atexit, logging, logging.handlers, os, queue, sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_root = logging.getLogger("stocksim")
+_root.setLevel(LOG_LEVEL)
+_root.propagate = False
+_root.addHandler(logging.handlers.QueueHandler(_queue))
+
+_out = logging.StreamHandler(sys.stdout)
+_out.setFormatter(logging.Formatter("%(asctime)s %(levelname)-5s %(message)s"))
+_listener = logging.handlers.QueueListener(_queue, _out)
+_listener.start()
+atexit.register(_listener.stop)                  # drain what's queued on exit
+
+def get_logger(name: str) -> logging.Logger:
+    return _root.getChild(name)
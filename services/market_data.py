@@ -0,0 +1,57 @@
+# services/market_data.py
+# API-side view of the engine's tickers (last / bid / ask / day stats).
+#
+# Fetched from the engine's /ticker endpoint on every shard and cached for
+# MARKET_DATA_TTL seconds, so portfolio valuation and /trades/ticker never
+# touch Postgres for prices.  If the engine can't be reached the last good
+# copy is served.
+import os, threading, time
+
+from dotenv import load_dotenv
+
+from services.log import get_logger
+from services.sharding import ENGINE_URLS, fetch_json, gather, shard_for
+
+load_dotenv()
+
+MARKET_DATA_TTL = float(os.getenv("MARKET_DATA_TTL", "1.0"))     # seconds
+
+log = get_logger("market")
+
+_lock      = threading.Lock()
+_cache: dict[str, dict] = {}
+_cached_at = float("-inf")
+
+def tickers() -> dict[str, dict]:
+    global _cache, _cached_at
+    if time.monotonic() - _cached_at < MARKET_DATA_TTL:
+        return _cache
+    with _lock:                                   # one refresh at a time
+        if time.monotonic() - _cached_at >= MARKET_DATA_TTL:
+            try:
+                fresh = {}
+                for part in gather("/ticker?local=true"):
+                    fresh.update(part)
+                _cache = fresh
+            except Exception as e:
+                log.warning("[MARKET] engine ticker unavailable: %r", e)
+            _cached_at = time.monotonic()
+    return _cache
+
+def ticker(symbol: str) -> dict | None:
+    return tickers().get(symbol.upper())
+
+def last_prices(symbols: list[str]) -> dict[str, float]:
+    """{symbol: last} for the symbols the engine has a price for."""
+    data = tickers()
+    return {s: data[s]["last"] for s in symbols
+            if s in data and data[s]["last"] is not None}
+
+def open_candle(symbol: str, interval: str) -> dict | None:
+    """The engine's still-open bar for a symbol, or None (also if it's down)."""
+    sym = symbol.upper()
+    try:
+        return fetch_json(f"{ENGINE_URLS[shard_for(sym)]}/candles/{sym}?interval={interval}")
+    except Exception as e:
+        log.warning("[MARKET] engine candles unavailable: %r", e)
+        return None
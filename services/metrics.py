@@ -0,0 +1,184 @@
+# services/metrics.py
+# Minimal in-process metrics with Prometheus text output.
+#
+#   ORDERS = Counter("engine_messages_total", "Messages processed", ["kind"])
+#   ORDERS.inc(kind="new")
+#   LAT = Histogram("order_stage_seconds", "Per-stage latency", ["stage"])
+#   LAT.observe(0.0012, stage="match")
+#   MATCH = LAT.child(stage="match"); MATCH.observe(0.0012)     # hot path
+#   Gauge("engine_resting_orders", "Resting orders", fn=lambda: len(order_index))
+#
+# Every metric registers itself; render() gives the text for a /metrics
+# endpoint.  Each process (API, every engine shard) has its own values –
+# scrape them all.  Updates take one uncontended lock, so they're safe
+# from the engine thread, the writer threads and the event loop alike.
+import bisect, threading
+from typing import Callable, Dict, Iterable
+
+# seconds – 50 µs … 10 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: list["_Metric"] = []
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Cell:
+    """One labelled series of a counter / gauge."""
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self.value += n
+
+    def set(self, v: float):
+        self.value = v
+
+
+class _Series:
+    """One labelled series of a histogram."""
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple, lock: threading.Lock):
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum     = 0.0
+        self._lock   = lock
+
+    def observe(self, v: float):
+        i = bisect.bisect_left(self.buckets, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum       += v
+
+
+class _Metric:
+    """
+    Base: label values → series.  child(**labels) returns the series
+    itself – hot paths bind it once and skip the label lookup.
+    """
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name    = name
+        self.help    = help
+        self.labels  = tuple(labels)
+        self._lock   = threading.Lock()
+        self._series: Dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _new(self):
+        raise NotImplementedError
+
+    def child(self, **labels):
+        key = tuple([str(labels[n]) for n in self.labels]) if self.labels else ()
+        s = self._series.get(key)
+        if s is None:
+            with self._lock:
+                s = self._series.setdefault(key, self._new())
+        return s
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new(self):
+        return _Cell(self._lock)
+
+    def inc(self, n: float = 1, **labels):
+        self.child(**labels).inc(n)
+
+    def value(self, **labels) -> float:
+        return self.child(**labels).value
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labels, k)} {c.value}"
+                for k, c in list(self._series.items())]
+
+
+class Gauge(Counter):
+    """Set / inc / dec, or computed at scrape time when given `fn`."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn: Callable[[], float | dict] | None = None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, v: float, **labels):
+        self.child(**labels).set(v)
+
+    def dec(self, n: float = 1, **labels):
+        self.child(**labels).inc(-n)
+
+    def samples(self):
+        if self.fn is None:
+            return super().samples()
+        try:
+            v = self.fn()
+        except Exception:
+            return []
+        if isinstance(v, dict):                   # {label value(s): number}
+            return [f"{self.name}{_labels(self.labels, k if isinstance(k, tuple) else (k,))} {x}"
+                    for k, x in v.items()]
+        return [f"{self.name} {v}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        return _Series(self.buckets, self._lock)
+
+    def observe(self, v: float, **labels):
+        self.child(**labels).observe(v)
+
+    def samples(self):
+        with self._lock:
+            series = [(k, list(s.counts), s.sum) for k, s in self._series.items()]
+        out = []
+        for key, counts, total in series:
+            acc = 0
+            for le, c in zip((*self.buckets, "+Inf"), counts):
+                acc += c
+                le = _labels(self.labels, key, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{le} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {acc}")
+        return out
+
+
+def render() -> str:
+    """Every registered metric in Prometheus text exposition format."""
+    return "".join(m.render() for m in list(_registry))
+
+
+# ---- shared: order lifecycle stages ------------------------------------
+#   api        – /orders/place-order handler (DB insert + publish)
+#   queue      – publish → engine picks it up (wall clock, crosses processes)
+#   match      – engine applies the message to the book
+#   persist    – fill handed to the trade writer → committed
+#   broadcast  – fill / delta posted → sent out to WebSocket clients
+STAGE_LATENCY = Histogram("order_stage_seconds", "Latency per order lifecycle stage", ["stage"])
@@ -1,57 +1,108 @@
 # services/portfolio.py
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
+from sqlalchemy import func, literal, select, union_all
 from models.trade import Trade
+from models.position import Position
+from services.market_data import last_prices
 
-def get_user_positions(user_id: int, db: Session):
+async def _last_prices(symbols: list[str], db: AsyncSession) -> dict[str, float]:
     """
-    Build current positions + P/L for a user from the trades table.
+    Latest trade price per symbol from the trades table – one DISTINCT ON
+    query.  Only used for symbols the engine ticker doesn't know.
     """
-    # ----- CASE helpers -------------------------------------------------
-    qty_case = case(
-        (Trade.buyer_id  == user_id,  Trade.quantity),
-        (Trade.seller_id == user_id, -Trade.quantity),
-        else_=0
-    )
-    spent_case = case(
-        (Trade.buyer_id == user_id, Trade.price * Trade.quantity),
-        else_=0          # sells don't raise cost basis
+    if not symbols:
+        return {}
+    rows = await db.execute(
+        select(Trade.stock_symbol, Trade.price)
+          .where(Trade.stock_symbol.in_(symbols))
+          .distinct(Trade.stock_symbol)
+          .order_by(Trade.stock_symbol, Trade.timestamp.desc())
     )
+    return {sym: px for sym, px in rows}
 
-    # ----- aggregate net qty & gross spent -----------------------------
-    rows = (
-        db.query(
-            Trade.stock_symbol.label("sym"),
-            func.sum(qty_case).label("net_qty"),
-            func.sum(spent_case).label("gross_spent")
-        )
-        .group_by(Trade.stock_symbol)
-        .having(func.sum(qty_case) != 0)           # ignore flat positions
-        .all()
-    )
+async def get_user_positions(user_id: int, db: AsyncSession):
+    """
+    Current positions + P/L for a user, read from the `positions` table
+    that the trade writer keeps up to date.
+    """
+    rows = (await db.scalars(
+        select(Position)
+          .where(Position.user_id == user_id,
+                 Position.buy_qty != Position.sell_qty)     # ignore flat positions
+    )).all()
+    symbols = [p.stock_symbol for p in rows]
+    last    = await run_in_threadpool(last_prices, symbols)   # engine ticker, cached
+    missing = [s for s in symbols if s not in last]
+    if missing:
+        last.update(await _last_prices(missing, db))
 
-    # ----- enrich with last price & compute P/L ------------------------
+    # ----- compute P/L -------------------------------------------------
     positions = {}
-    for sym, net_qty, gross_spent in rows:
-        last_trade = (
-            db.query(Trade)
-              .filter(Trade.stock_symbol == sym)
-              .order_by(Trade.timestamp.desc())
-              .first()                # ← always 0-or-1 row, no exception
-        )
-        last_px = last_trade.price if last_trade else 0
+    for p in rows:
+        net_qty     = p.buy_qty - p.sell_qty
+        gross_spent = p.buy_value                # sells don't raise cost basis
+        last_px     = last.get(p.stock_symbol, 0)
 
         market_val = net_qty * last_px
         avg_cost   = abs(gross_spent) / abs(net_qty)
         pnl        = market_val - gross_spent
 
-        positions[sym] = {
-            "shares":     net_qty,
-            "avg_cost":   round(avg_cost, 2),
-            "invested":   round(gross_spent, 2),
-            "last_px":    last_px,
-            "market_val": round(market_val, 2),
-            "pnl":        round(pnl, 2),
+        # closed quantity at the average sell minus average buy price
+        closed   = min(p.buy_qty, p.sell_qty)
+        realized = closed * (p.sell_value / p.sell_qty - p.buy_value / p.buy_qty) if closed else 0.0
+
+        positions[p.stock_symbol] = {
+            "shares":       net_qty,
+            "avg_cost":     round(avg_cost, 2),
+            "invested":     round(gross_spent, 2),
+            "last_px":      last_px,
+            "market_val":   round(market_val, 2),
+            "pnl":          round(pnl, 2),
+            "realized_pnl": round(realized, 2),
         }
 
     return positions
+
+def rebuild_positions(db: Session) -> int:
+    """
+    Backfill: recompute every row of `positions` from the trades table.
+    Run it with the engine stopped, or fills written meanwhile are lost.
+    """
+    legs = union_all(
+        select(Trade.buyer_id.label("user_id"), Trade.stock_symbol,
+               Trade.quantity.label("bq"), (Trade.price * Trade.quantity).label("bv"),
+               literal(0).label("sq"), literal(0.0).label("sv")),
+        select(Trade.seller_id, Trade.stock_symbol,
+               literal(0), literal(0.0),
+               Trade.quantity, Trade.price * Trade.quantity),
+    ).subquery()
+    totals = select(
+        legs.c.user_id, legs.c.stock_symbol,
+        func.sum(legs.c.bq), func.sum(legs.c.bv),
+        func.sum(legs.c.sq), func.sum(legs.c.sv),
+    ).group_by(legs.c.user_id, legs.c.stock_symbol)
+
+    db.query(Position).delete()
+    db.execute(
+        Position.__table__.insert().from_select(
+            ["user_id", "stock_symbol", "buy_qty", "buy_value", "sell_qty", "sell_value"],
+            totals,
+        )
+    )
+    db.commit()
+    return db.query(Position).count()
+
+if __name__ == "__main__":            # python -m services.portfolio backfill
+    import sys
+    from db.database import Base, SessionLocal, engine
+
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m services.portfolio backfill")
+    Base.metadata.create_all(bind=engine, tables=[Position.__table__])
+    db = SessionLocal()
+    try:
+        print(f"[POSITIONS] rebuilt {rebuild_positions(db)} rows from trades")
+    finally:
+        db.close()
@@ -1,13 +1,26 @@
-import pika
-import json
+# services/queue.py
+# Shared order publisher for the API.  Which transport carries the
+# messages (RabbitMQ, a Unix socket, in-process) is ORDER_TRANSPORT – see
+# services/transport.py; this module only routes them to the right queue.
+from services.sharding import queue_for
+from services.transport import make_transport
+
+publisher = make_transport()
 
 def publish_order(order_data: dict):
-    connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
-    channel = connection.channel()
-    channel.queue_declare(queue="order_queue")
-    channel.basic_publish(
-        exchange="",
-        routing_key="order_queue",
-        body=json.dumps(order_data)
-    )
-    connection.close()
+    publisher.publish(queue_for("order_queue", order_data["stock_symbol"]), order_data)
+
+# engine message kind → the queue its consumer reads
+KIND_QUEUES = {"new": "order_queue", "amend": "order_amend_queue", "cancel": "order_cancel_queue"}
+
+def publish_orders(messages: list[dict]):
+    """
+    Publish a mix of new / amend / cancel messages: one publish_many per
+    destination (kind × engine shard), each in the original order.
+    """
+    groups: dict[str, list[dict]] = {}
+    for m in messages:
+        q = queue_for(KIND_QUEUES[m.get("kind") or "new"], m["stock_symbol"])
+        groups.setdefault(q, []).append(m)
+    for q, batch in groups.items():
+        publisher.publish_many(q, batch)
@@ -0,0 +1,58 @@
+# services/sharding.py
+# Symbol → engine shard routing, shared by the API (producers) and the
+# matching-engine workers.
+#
+# With ENGINE_SHARDS=1 (default) queue names stay exactly as before.  With
+# N > 1 every symbol is owned by shard crc32(symbol) % N, which consumes
+# "<queue>.<shard>" and serves its order book on ENGINE_BASE_PORT + shard.
+import json, os, zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ENGINE_SHARDS    = int(os.getenv("ENGINE_SHARDS", "1"))
+ENGINE_HOST      = os.getenv("ENGINE_HOST", "localhost")
+ENGINE_BASE_PORT = int(os.getenv("ENGINE_BASE_PORT", "8001"))
+# optional explicit list, e.g. "http://eng0:8001,http://eng1:8001"
+ENGINE_URLS      = [u.strip().rstrip("/") for u in os.getenv("ENGINE_URLS", "").split(",") if u.strip()] \
+                   or [f"http://{ENGINE_HOST}:{ENGINE_BASE_PORT + i}" for i in range(ENGINE_SHARDS)]
+
+def shard_for(symbol: str) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    if ENGINE_SHARDS == 1:
+        return 0
+    return zlib.crc32(symbol.upper().encode()) % ENGINE_SHARDS
+
+def shard_queue(queue: str, shard: int) -> str:
+    return queue if ENGINE_SHARDS == 1 else f"{queue}.{shard}"
+
+def queue_for(queue: str, symbol: str) -> str:
+    return shard_queue(queue, shard_for(symbol))
+
+def fetch_json(url: str, timeout: float = 2.0):
+    with urlopen(url, timeout=timeout) as r:
+        return json.load(r)
+
+def fetch_cached(url: str, etag: str | None = None, timeout: float = 2.0) -> tuple[int, str | None, bytes]:
+    """
+    GET with If-None-Match: (status, ETag, body).  A 304 comes back with an
+    empty body; other HTTP errors are returned as they are, not raised.
+    """
+    req = Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urlopen(req, timeout=timeout) as r:
+            return r.status, r.headers.get("ETag"), r.read()
+    except HTTPError as e:
+        return e.code, e.headers.get("ETag") or (etag if e.code == 304 else None), e.read()
+
+def gather(path: str, skip: int | None = None) -> list:
+    """GET `path` from every shard (except `skip`) in parallel."""
+    urls = [u + path for i, u in enumerate(ENGINE_URLS) if i != skip]
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        return list(pool.map(fetch_json, urls))
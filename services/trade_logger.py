@@ -1,38 +1,245 @@
+# services/trade_logger.py
+# Group-commit trade writer.
+#
+# The engine (its "db" sink) hands fills to the writer, which only
+# enqueues them.  A background thread drains the queue in batches
+# (TRADE_BATCH_SIZE rows or TRADE_FLUSH_INTERVAL seconds, whichever comes
+# first) and per batch:
+#   • bulk-inserts the Trade rows (one executemany)
+#   • nets cash per user across the batch and applies one
+#     `UPDATE balances SET cash = cash + :delta` per user
+#   • nets position totals per (user, symbol) and upserts them
+#   • commits once
+# A batch that still fails after TRADE_WRITE_RETRIES quick attempts is
+# kept, not dropped: fills arriving meanwhile join it, and the whole lot is
+# retried with exponential backoff (TRADE_RETRY_BACKOFF … TRADE_RETRY_MAX
+# seconds) until Postgres takes it.  flush() returns False while anything
+# it waited for is still uncommitted.
+import atexit, os, queue, threading, time
+from collections import defaultdict
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from db.database import SessionLocal
 from models.trade import Trade
 from models.balance import Balance
+from models.position import Position
+from models.user import User          # noqa: F401 – resolves Balance.user in the engine
+from services.log import get_logger
+from services.metrics import Counter, Gauge, STAGE_LATENCY
+
+load_dotenv()
+
+log = get_logger("trades")
+
+TRADE_BATCH_SIZE     = int(os.getenv("TRADE_BATCH_SIZE", "500"))
+TRADE_FLUSH_INTERVAL = float(os.getenv("TRADE_FLUSH_INTERVAL", "0.05"))   # seconds
+TRADE_WRITE_RETRIES  = 3
+TRADE_RETRY_BACKOFF  = float(os.getenv("TRADE_RETRY_BACKOFF", "0.5"))   # first wait after a failed batch
+TRADE_RETRY_MAX      = float(os.getenv("TRADE_RETRY_MAX", "10"))        # backoff cap, seconds
+
+_balances = Balance.__table__
+_cash_update = (
+    _balances.update()
+    .where(_balances.c.user_id == bindparam("uid"))
+    .values(cash=_balances.c.cash + bindparam("delta"))
+)
+
+_positions = Position.__table__
+_pos_cols  = ("buy_qty", "buy_value", "sell_qty", "sell_value")
+_pos_ins   = pg_insert(_positions)
+_position_upsert = _pos_ins.on_conflict_do_update(
+    index_elements=[_positions.c.user_id, _positions.c.stock_symbol],
+    set_={c: _positions.c[c] + _pos_ins.excluded[c] for c in _pos_cols},
+)
+
+_STOP = object()
+
+
+class _Waiter(threading.Event):
+    """A flush() marker; `ok` says whether everything before it was committed."""
+    ok = False
+
+TRADES_WRITTEN = Counter("trades_written_total", "Fills committed to Postgres")
+WRITE_ERRORS   = Counter("trade_write_errors_total", "Failed trade batch commits")
+
+
+class TradeWriter:
+    """Background thread that persists fills in batches."""
+
+    def __init__(self, batch_size: int = TRADE_BATCH_SIZE,
+                 flush_interval: float = TRADE_FLUSH_INTERVAL):
+        self.batch_size     = batch_size
+        self.flush_interval = flush_interval
+        self._q: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.unwritten = 0                        # fills held back by failed commits
+
+    # ---- producer side (engine thread) --------------------------------
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="trade-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, buyer_id, seller_id, stock_symbol, price, quantity):
+        if self._thread is None:
+            self.start()
+        self._q.put({
+            "buyer_id":     buyer_id,
+            "seller_id":    seller_id,
+            "stock_symbol": stock_symbol,
+            "price":        price,
+            "quantity":     quantity,
+            "timestamp":    datetime.utcnow(),
+            "_t":           time.monotonic(),     # for the persist-stage latency
+        })
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Block until everything submitted so far is committed.  False if it
+        isn't – the timeout ran out, or the writer's latest attempt failed
+        and the fills are waiting for the next retry.
+        """
+        if self._thread is None:
+            return True
+        done = _Waiter()
+        self._q.put(done)
+        return done.wait(timeout) and done.ok
+
+    def close(self, timeout: float | None = 10.0):
+        """Write out what is still queued and stop the thread."""
+        if self._thread is None:
+            return
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.error("[ERROR] %s fills still uncommitted at shutdown",
+                      self.unwritten + self._q.qsize())
+        self._thread = None
+
+    # ---- writer thread ------------------------------------------------
+    def _run(self):
+        rows, stamps = [], []                     # collected, not committed yet
+        retry_at, backoff, stopping = 0.0, TRADE_RETRY_BACKOFF, False
+        while True:
+            wait = max(retry_at - time.monotonic(), 0.0) if rows else None
+            batch, waiters, stop = self._collect(wait)
+            stopping = stopping or stop
+            for r in batch:
+                stamps.append(r.pop("_t"))
+                rows.append(r)
+            if rows and (time.monotonic() >= retry_at or stopping):
+                if self._write(rows, stamps):
+                    rows, stamps = [], []
+                    backoff = TRADE_RETRY_BACKOFF
+                else:                             # keep them, try again later
+                    retry_at = time.monotonic() + backoff
+                    log.error("[ERROR] %s fills not committed – retrying in %.1fs", len(rows), backoff)
+                    backoff  = min(backoff * 2, TRADE_RETRY_MAX)
+            self.unwritten = len(rows)
+            for ev in waiters:
+                ev.ok = not rows
+                ev.set()
+            if stopping and not rows:
+                return
+
+    def _collect(self, wait: float | None = None):
+        """Next batch; `wait` = seconds to wait for a first item (None = forever)."""
+        batch, waiters, stop = [], [], False
+        try:
+            item = self._q.get(timeout=wait)
+        except queue.Empty:
+            return batch, waiters, stop
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, _Waiter):
+                waiters.append(item)
+            else:
+                batch.append(item)
+
+            if stop or len(batch) >= self.batch_size:
+                break
+            if waiters and self._q.empty():
+                break                             # someone is waiting – go now
+            left = deadline - time.monotonic()
+            try:
+                item = self._q.get(timeout=left) if left > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+
+        if stop:                                  # durable flush on shutdown
+            while True:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, _Waiter):
+                    waiters.append(item)
+                elif item is not _STOP:
+                    batch.append(item)
+        return batch, waiters, stop
+
+    def _write(self, rows: list[dict], submitted: list[float]) -> bool:
+        """Commit one batch (a few quick retries); False if it is still not in."""
+        deltas: dict[int, float] = defaultdict(float)
+        pos:    dict[tuple[int, str], list] = defaultdict(lambda: [0, 0.0, 0, 0.0])
+        for r in rows:
+            total_cost = r["price"] * r["quantity"]
+            deltas[r["buyer_id"]]  -= total_cost
+            deltas[r["seller_id"]] += total_cost
+
+            b = pos[r["buyer_id"], r["stock_symbol"]]
+            b[0] += r["quantity"]; b[1] += total_cost
+            s = pos[r["seller_id"], r["stock_symbol"]]
+            s[2] += r["quantity"]; s[3] += total_cost
+        # fixed lock order so concurrent writers can't deadlock
+        cash = [{"uid": uid, "delta": d} for uid, d in sorted(deltas.items()) if d]
+        positions = [
+            {"user_id": uid, "stock_symbol": sym, **dict(zip(_pos_cols, v))}
+            for (uid, sym), v in sorted(pos.items())
+        ]
+
+        for attempt in range(1, TRADE_WRITE_RETRIES + 1):
+            db = SessionLocal()
+            try:
+                db.execute(insert(Trade), rows)
+                if cash:
+                    db.execute(_cash_update, cash)
+                db.execute(_position_upsert, positions)
+                db.commit()
+                done = time.monotonic()
+                persist = STAGE_LATENCY.child(stage="persist")
+                for t in submitted:
+                    persist.observe(done - t)
+                TRADES_WRITTEN.inc(len(rows))
+                log.debug("[LOGGING] %s trades recorded, %s balances updated",
+                          len(rows), len(cash))
+                return True
+            except Exception as e:
+                db.rollback()
+                WRITE_ERRORS.inc()
+                log.error("[ERROR] Failed to record %s trades (attempt %s/%s): %s",
+                          len(rows), attempt, TRADE_WRITE_RETRIES, e)
+                time.sleep(0.1 * attempt)
+            finally:
+                db.close()
+        return False
+
+
+trade_writer = TradeWriter()
+Gauge("trade_writer_queue", "Fills waiting for the trade writer", fn=lambda: trade_writer._q.qsize())
+Gauge("trade_writer_unwritten", "Fills held back by failed commits, awaiting retry",
+      fn=lambda: trade_writer.unwritten)
+atexit.register(trade_writer.close)
 
 def record_trade(buyer_id, seller_id, stock_symbol, price, quantity):
-    db = SessionLocal()
-    try:
-        # Insert the trade record
-        trade = Trade(
-            buyer_id=buyer_id,
-            seller_id=seller_id,
-            stock_symbol=stock_symbol,
-            price=price,
-            quantity=quantity
-        )
-        db.add(trade)
-
-        total_cost = price * quantity
-
-        # Update buyer and seller balances
-        buyer_balance = db.query(Balance).filter(Balance.user_id == buyer_id).first()
-        if buyer_balance:
-            buyer_balance.cash -= total_cost
-
-        seller_balance = db.query(Balance).filter(Balance.user_id == seller_id).first()
-        if seller_balance:
-            seller_balance.cash += total_cost
-
-        db.commit()
-
-        print(f"[LOGGING] Trade recorded and balances updated: buyer -{total_cost}, seller +{total_cost}")
-        print(f"[BALANCE] Buyer New Cash: {buyer_balance.cash}, Seller New Cash: {seller_balance.cash}")
-
-    except Exception as e:
-        db.rollback()
-        print(f"[ERROR] Failed to record trade: {e}")
-    finally:
-        db.close()
+    """Queue one fill for the background writer (non-blocking)."""
+    trade_writer.submit(buyer_id, seller_id, stock_symbol, price, quantity)
@@ -0,0 +1,386 @@
+# services/transport.py
+# How order messages get from the API to the engine.  ORDER_TRANSPORT
+# picks one backend:
+#   rabbitmq  – durable broker queues (the default; API and engine anywhere)
+#   unix      – a Unix-domain stream socket per engine shard (one box, no
+#               broker, lowest latency)
+#   memory    – an in-process queue (API and engine in one process: tests,
+#               embedding)
+# A transport has publish / publish_many on the producer side and
+# consume(queues, handle) on the engine side; acks(ack_mode) tells the
+# engine whether a batch is acked after handle() – only then is it worth
+# waiting for the batch's fills and journal to be durable first.  consume() blocks, calling
+# handle(bodies) with batches of up to `prefetch` raw message bodies in
+# arrival order: once the first message is in, it waits at most `wait`
+# seconds for the batch to fill.  RabbitMQ acks the batch after handle()
+# returns (at-least-once); if handle() raises, consume() closes the
+# connection without acking – the broker requeues the batch – and re-raises.  The unix and memory backends have nothing to
+# ack: a message is gone once handed over, so whatever the engine had not
+# journaled when it died is lost – use them where that is acceptable.
+#
+# The unix wire format is a stream of frames
+#   <len:u32><qlen:u16><queue name><body>      (len = everything after it)
+# and publish_many writes a whole batch with one sendall().
+import json, os, queue, selectors, socket, struct, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import pika
+from dotenv import load_dotenv
+
+from services.log import get_logger
+from services.sharding import ENGINE_SHARDS
+
+load_dotenv()
+
+ORDER_TRANSPORT      = os.getenv("ORDER_TRANSPORT", "rabbitmq")
+RABBITMQ_HOST        = os.getenv("RABBITMQ_HOST", "localhost")
+RABBITMQ_POOL_SIZE   = int(os.getenv("RABBITMQ_POOL_SIZE", "4"))
+RABBITMQ_CONFIRMS    = os.getenv("RABBITMQ_CONFIRMS", "false").lower() in ("1", "true", "yes")
+TRANSPORT_SOCKET_DIR = os.getenv("TRANSPORT_SOCKET_DIR", "/tmp")
+
+log = get_logger("transport")
+
+Handler = Callable[[List[bytes]], None]
+
+
+def _shard(queue_name: str) -> int:
+    """Shard a (possibly suffixed) queue name belongs to, see sharding.shard_queue."""
+    return int(queue_name.rpartition(".")[2]) if ENGINE_SHARDS > 1 else 0
+
+
+class Transport:
+    """Producer half shared by every backend: stamp, encode, hand over."""
+
+    def publish(self, queue_name: str, message: dict):
+        self.publish_many(queue_name, [message])
+
+    def publish_many(self, queue_name: str, messages: list[dict]):
+        now = time.time()                         # engine measures queue lag from this
+        self._send(queue_name, [json.dumps({**m, "sent_at": now}).encode() for m in messages])
+
+    def _send(self, queue_name: str, bodies: list[bytes]):
+        raise NotImplementedError
+
+    def consume(self, queues: list[str], handle: Handler, prefetch: int = 500,
+                wait: float = 0.005, ack_mode: str = "batch"):
+        raise NotImplementedError
+
+    def acks(self, ack_mode: str = "batch") -> bool:
+        """True if consume() acks each batch once handle() returns."""
+        return False
+
+    def close(self):
+        pass
+
+
+class _Pool:
+    """A fixed set of slots that worker threads check out one at a time."""
+
+    def __init__(self, slots: list):
+        self._slots = slots
+        self._pool: queue.LifoQueue = queue.LifoQueue()   # reuse warm slots first
+        for slot in slots:
+            self._pool.put(slot)
+
+    @contextmanager
+    def slot(self):
+        slot = self._pool.get()
+        try:
+            yield slot
+        finally:
+            self._pool.put(slot)
+
+    def close(self):
+        for slot in self._slots:
+            slot.close()
+
+
+# ─────────────────────────── rabbitmq ───────────────────────────
+class _RabbitSlot:
+    """One pooled connection + channel, opened lazily."""
+
+    def __init__(self, params: pika.ConnectionParameters, confirms: bool):
+        self.params   = params
+        self.confirms = confirms
+        self.conn: pika.BlockingConnection | None = None
+        self.ch = None
+        self.declared: set[str] = set()
+        self.sent = 0                             # bodies of the last publish() that went out
+
+    def ensure(self):
+        if self.conn is None or self.conn.is_closed or self.ch.is_closed:
+            self.close()
+            self.conn = pika.BlockingConnection(self.params)
+            self.ch   = self.conn.channel()
+            if self.confirms:
+                self.ch.confirm_delivery()
+        else:
+            self.conn.process_data_events(0)      # service heartbeats
+
+    def publish(self, queue_name: str, bodies: list[bytes]):
+        if queue_name not in self.declared:
+            self.ch.queue_declare(queue=queue_name)
+            self.declared.add(queue_name)
+        self.sent = 0
+        for body in bodies:
+            # with confirms this returns once the broker has the message
+            self.ch.basic_publish(exchange="", routing_key=queue_name, body=body)
+            self.sent += 1
+
+    def close(self):
+        if self.conn is not None and self.conn.is_open:
+            try:
+                self.conn.close()
+            except pika.exceptions.AMQPError:
+                pass
+        self.conn, self.ch = None, None
+        self.declared.clear()
+
+
+class RabbitTransport(Transport):
+    """
+    Pooled BlockingConnections (one channel each) with reconnect and
+    optional publisher confirms.  BlockingConnection isn't thread-safe, so
+    a slot is only ever used by one thread at a time.
+    """
+
+    def __init__(self, host: str = RABBITMQ_HOST, pool_size: int = RABBITMQ_POOL_SIZE,
+                 confirms: bool = RABBITMQ_CONFIRMS):
+        self.params = pika.ConnectionParameters(host)
+        self._pool  = _Pool([_RabbitSlot(self.params, confirms) for _ in range(pool_size)])
+        self._closed = threading.Event()
+
+    def _send(self, queue_name: str, bodies: list[bytes]):
+        """
+        A failed batch is retried once on a fresh connection (never lost
+        silently: the second failure is raised to the caller).  With
+        publisher confirms every message before the failure is known to
+        be in, so only the rest is resent; without them there is no
+        telling, so the whole batch goes again and the engine skips the
+        copies it already applied (its dedup window, see journal.py).
+        """
+        if self._closed.is_set():
+            raise RuntimeError("publisher is closed")
+        with self._pool.slot() as slot:
+            for attempt in (1, 2):
+                try:
+                    slot.ensure()
+                    slot.publish(queue_name, bodies)
+                    return
+                except pika.exceptions.AMQPError as e:
+                    if slot.confirms:
+                        bodies = bodies[slot.sent:]   # confirmed ones stay published
+                    slot.close()
+                    log.warning("[QUEUE] publish to %s failed (attempt %s): %r", queue_name, attempt, e)
+                    if attempt == 2:
+                        raise
+
+    def acks(self, ack_mode="batch"):
+        return ack_mode != "auto"
+
+    def consume(self, queues, handle, prefetch=500, wait=0.005, ack_mode="batch"):
+        conn = pika.BlockingConnection(self.params)
+        ch   = conn.channel()
+        for q in queues:
+            ch.queue_declare(q)
+
+        if ack_mode == "auto":                    # fire-and-forget, one by one
+            for q in queues:
+                ch.basic_consume(q, lambda _ch, _m, _p, body: handle([body]), auto_ack=True)
+            ch.start_consuming()
+            return
+
+        # callbacks only buffer; the loop drains up to `prefetch` messages,
+        # hands them over in delivery order, then acks the whole batch with
+        # one multiple=True ack
+        ch.basic_qos(prefetch_count=prefetch)
+        pending: list[tuple[int, bytes]] = []
+
+        def buffer(_ch, method, _p, body):
+            pending.append((method.delivery_tag, body))
+
+        for q in queues:
+            ch.basic_consume(q, buffer)
+
+        try:
+            while True:
+                conn.process_data_events(time_limit=None)    # block for the first
+                while pending and len(pending) < prefetch:
+                    n = len(pending)
+                    conn.process_data_events(time_limit=wait)
+                    if len(pending) == n:
+                        break
+                if not pending:
+                    continue
+                batch = pending[:]
+                pending.clear()
+                handle([body for _tag, body in batch])
+                ch.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+        finally:                                  # handle() raised: unacked → requeued
+            if conn.is_open:
+                conn.close()
+
+    def close(self):
+        self._closed.set()
+        self._pool.close()
+
+
+# ───────────────────────────── unix ─────────────────────────────
+_HEAD = struct.Struct("<IH")
+
+
+def _frames(queue_name: str, bodies: list[bytes]) -> bytes:
+    q = queue_name.encode()
+    return b"".join(_HEAD.pack(2 + len(q) + len(b), len(q)) + q + b for b in bodies)
+
+
+class _UnixSlot:
+    """Lazily opened sockets, one per engine shard."""
+
+    def __init__(self):
+        self.socks: Dict[str, socket.socket] = {}
+
+    def send(self, path: str, data: bytes):
+        s = self.socks.get(path)
+        if s is None:
+            s = self.socks[path] = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.connect(path)
+            except OSError:
+                del self.socks[path]
+                s.close()
+                raise
+        s.sendall(data)
+
+    def drop(self, path: str):
+        s = self.socks.pop(path, None)
+        if s is not None:
+            s.close()
+
+    def close(self):
+        for path in list(self.socks):
+            self.drop(path)
+
+
+class UnixTransport(Transport):
+    """Engine shard i listens on TRANSPORT_SOCKET_DIR/stocksim-engine-<i>.sock."""
+
+    def __init__(self, directory: str = TRANSPORT_SOCKET_DIR, pool_size: int = RABBITMQ_POOL_SIZE):
+        self.dir   = directory
+        self._pool = _Pool([_UnixSlot() for _ in range(pool_size)])
+
+    def path(self, shard: int) -> str:
+        return os.path.join(self.dir, f"stocksim-engine-{shard}.sock")
+
+    def _send(self, queue_name: str, bodies: list[bytes]):
+        path, data = self.path(_shard(queue_name)), _frames(queue_name, bodies)
+        with self._pool.slot() as slot:
+            for attempt in (1, 2):
+                try:
+                    slot.send(path, data)
+                    return
+                except OSError as e:          # engine restarted – reconnect once
+                    slot.drop(path)
+                    log.warning("[QUEUE] send to %s failed (attempt %s): %r", path, attempt, e)
+                    if attempt == 2:
+                        raise
+
+    def consume(self, queues, handle, prefetch=500, wait=0.005, ack_mode="batch"):
+        path = self.path(_shard(queues[0]))
+        if os.path.exists(path):
+            os.unlink(path)                       # left over from a previous run
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        srv.bind(path)
+        srv.listen()
+        srv.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(srv, selectors.EVENT_READ)
+        wanted = {q.encode() for q in queues}
+        bufs: Dict[socket.socket, bytearray] = {}
+        pending: list[bytes] = []
+        deadline = None                           # when the current batch must go
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            for key, _ in sel.select(timeout):
+                if key.fileobj is srv:
+                    conn, _ = srv.accept()
+                    conn.setblocking(False)
+                    sel.register(conn, selectors.EVENT_READ)
+                    bufs[conn] = bytearray()
+                    continue
+                conn = key.fileobj
+                data = conn.recv(1 << 16)
+                if not data:                      # producer went away
+                    sel.unregister(conn)
+                    conn.close()
+                    del bufs[conn]
+                    continue
+                buf = bufs[conn]
+                buf += data
+                pos = 0
+                while pos + _HEAD.size <= len(buf):
+                    n, qlen = _HEAD.unpack_from(buf, pos)
+                    end = pos + 4 + n
+                    if end > len(buf):
+                        break                     # rest of the frame not here yet
+                    q = bytes(buf[pos + _HEAD.size:pos + _HEAD.size + qlen])
+                    if q in wanted:
+                        pending.append(bytes(buf[pos + _HEAD.size + qlen:end]))
+                    else:
+                        log.warning("[QUEUE] %s: message for %r dropped", path, q.decode())
+                    pos = end
+                del buf[:pos]
+
+            if pending and deadline is None:
+                deadline = time.monotonic() + wait
+            while pending and (len(pending) >= prefetch or time.monotonic() >= deadline):
+                batch, pending[:] = pending[:prefetch], pending[prefetch:]
+                handle(batch)
+            if not pending:
+                deadline = None
+
+    def close(self):
+        self._pool.close()
+
+
+# ──────────────────────────── memory ────────────────────────────
+class MemoryTransport(Transport):
+    """One in-process inbox per engine shard; bodies are still JSON bytes."""
+
+    _inboxes: Dict[int, queue.SimpleQueue] = {}   # shared by every instance
+    _lock = threading.Lock()
+
+    def _inbox(self, shard: int) -> queue.SimpleQueue:
+        with self._lock:
+            return self._inboxes.setdefault(shard, queue.SimpleQueue())
+
+    def _send(self, queue_name: str, bodies: list[bytes]):
+        inbox = self._inbox(_shard(queue_name))
+        for body in bodies:
+            inbox.put((queue_name, body))
+
+    def consume(self, queues, handle, prefetch=500, wait=0.005, ack_mode="batch"):
+        inbox, wanted = self._inbox(_shard(queues[0])), set(queues)
+        while True:
+            batch    = [inbox.get()]
+            deadline = time.monotonic() + wait
+            while len(batch) < prefetch:
+                left = deadline - time.monotonic()
+                try:
+                    batch.append(inbox.get(timeout=left) if left > 0 else inbox.get_nowait())
+                except queue.Empty:
+                    break
+            bodies = [body for q, body in batch if q in wanted]
+            if bodies:
+                handle(bodies)
+
+
+TRANSPORTS = {"rabbitmq": RabbitTransport, "unix": UnixTransport, "memory": MemoryTransport}
+
+def make_transport(name: str = ORDER_TRANSPORT) -> Transport:
+    try:
+        return TRANSPORTS[name]()
+    except KeyError:
+        raise ValueError(f"ORDER_TRANSPORT must be one of {', '.join(TRANSPORTS)}, not {name!r}")
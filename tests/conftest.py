@@ -0,0 +1,34 @@
+# tests/conftest.py
+# The tests run in-process with no RabbitMQ / Postgres: the engine and API
+# modules read these at import time, so they are set before any test
+# module imports them.
+import os
+
+os.environ.update(ENGINE_TRADE_SINK="null", ENGINE_RISK="off", JOURNAL_DIR="",
+                  ORDER_TRANSPORT="memory", ENGINE_SHARDS="1")
+for name, value in (("SECRET_KEY", "test"), ("ALGORITHM", "HS256"),
+                    ("ACCESS_TOKEN_EXPIRE_MINUTES", "30")):
+    os.environ.setdefault(name, value)
+
+import pytest
+
+from matching_engine import consumer, replay
+from matching_engine.journal import Journal
+
+
+@pytest.fixture
+def engine():
+    """Fresh books (replay.reset) with fills going to a MemorySink."""
+    sink = replay.reset("memory")
+    yield sink
+    replay.reset("null")
+
+
+def recover(directory: str, snapshot_every: int = 100_000) -> int:
+    """consumer.recover() on a journal directory of the test's own."""
+    consumer.journal   = Journal(directory, snapshot_every, recent=consumer.recent)
+    consumer.replaying = True
+    try:
+        return consumer.journal.recover(consumer.dispatch)
+    finally:
+        consumer.replaying = False
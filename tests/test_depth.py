@@ -0,0 +1,100 @@
+# tests/test_depth.py
+# A /ws/depth client rebuilt from snapshot + deltas must hold the book's
+# true top-N after every message, whenever it subscribed.
+import pytest
+
+from benchmarks.flows import FLOWS
+from matching_engine import consumer, depth
+from matching_engine.order_book import PRICE_SCALE, order_books
+
+N = depth.DEPTH_LEVELS
+
+
+class Client:
+    """Applies a snapshot, then every delta with a higher seq, like a WS client."""
+
+    def __init__(self, snap: dict):
+        self.seq  = snap["seq"]
+        self.bids = dict(map(tuple, snap["bids"]))
+        self.asks = dict(map(tuple, snap["asks"]))
+
+    def apply(self, delta: dict):
+        if delta["seq"] <= self.seq:
+            return
+        assert delta["seq"] == self.seq + 1, "gap in the delta stream"
+        self.seq = delta["seq"]
+        for side, changes in ((self.bids, delta["bids"]), (self.asks, delta["asks"])):
+            for px, qty in changes:
+                if qty:
+                    side[px] = qty
+                else:
+                    side.pop(px, None)
+
+
+def true_top(symbol: str) -> tuple[dict, dict]:
+    book = order_books.get(symbol)
+    if book is None:
+        return {}, {}
+    bids = sorted(book.buy.depth.items(), reverse=True)[:N]
+    asks = sorted(book.sell.depth.items())[:N]
+    return ({px / PRICE_SCALE: q for px, q in bids},
+            {px / PRICE_SCALE: q for px, q in asks})
+
+
+@pytest.fixture
+def feed(engine, monkeypatch):
+    """AAPL watched; depth deltas collected instead of broadcast."""
+    deltas: list[dict] = []
+
+    def post(data: dict, channel: str = "trades"):
+        if channel == "depth":
+            deltas.append(data)
+
+    monkeypatch.setattr(consumer, "watched", lambda channel: frozenset({"AAPL"}))
+    monkeypatch.setattr(consumer.outbox, "post", post)
+    return deltas
+
+
+@pytest.mark.parametrize("flow", ["uniform", "market_maker", "cancel_storm", "deep_sweep"])
+@pytest.mark.parametrize("join_at", [0, 500])
+def test_deltas_track_true_top_n(feed, flow, join_at):
+    client = None
+    for i, msg in enumerate(FLOWS[flow](1500, 11)):
+        if i == join_at:
+            book = order_books.get("AAPL")
+            client = Client(depth.snapshot(book, N) if book else depth.empty("AAPL"))
+            feed.clear()
+        consumer.dispatch(msg)
+        if client is None:
+            continue
+        for delta in feed:
+            client.apply(delta)
+        feed.clear()
+        assert (client.bids, client.asks) == true_top("AAPL"), f"after message {i}"
+
+
+def test_cold_symbol_resubscribe(feed, monkeypatch):
+    msgs = FLOWS["uniform"](600, 5)
+    for msg in msgs[:200]:
+        consumer.dispatch(msg)
+    client = Client(depth.snapshot(order_books["AAPL"], N))
+    monkeypatch.setattr(consumer, "watched", lambda channel: frozenset())
+    for msg in msgs[200:400]:                             # nobody watching: goes cold
+        consumer.dispatch(msg)
+    monkeypatch.setattr(consumer, "watched", lambda channel: frozenset({"AAPL"}))
+    snap = depth.snapshot(order_books["AAPL"], N)
+    assert snap["seq"] > client.seq                       # a fresh snapshot, never an older seq
+    client = Client(snap)
+    feed.clear()
+    for msg in msgs[400:]:
+        consumer.dispatch(msg)
+        for delta in feed:
+            client.apply(delta)
+        feed.clear()
+        assert (client.bids, client.asks) == true_top("AAPL")
+
+
+def test_unknown_symbol_creates_no_book(engine):
+    assert depth.empty("NOPE") == {"type": "snapshot", "symbol": "NOPE", "seq": 0,
+                                   "bids": [], "asks": []}
+    assert "NOPE" not in order_books
@@ -0,0 +1,103 @@
+# tests/test_journal.py
+# Binary format round trips, and recovery: snapshot + journal tail, a torn
+# last frame, and redeliveries of a batch the snapshot already holds.
+import json, math, os
+
+from benchmarks.flows import FLOWS
+from matching_engine import consumer, replay
+from matching_engine.journal import (_AMEND, _FRAME, _MAGIC1, _SNAP, _frame,
+                                     decode, encode, event_key, read_segment, read_snapshot)
+from matching_engine.order_book import order_books, order_index
+from tests.conftest import recover
+
+NEW    = {"kind": "new", "order_id": 1, "user_id": 2, "stock_symbol": "AAPL",
+          "quantity": 10, "price": 101.25, "order_type": "sell", "sent_at": 1700000000.5}
+AMEND  = {"kind": "amend", "order_id": 1, "user_id": 2, "fields": {"quantity": 4},
+          "sent_at": 1700000001.0}
+CANCEL = {"kind": "cancel", "order_id": 1, "user_id": 2}
+
+
+def books() -> dict:
+    return {sym: {side: [o.as_dict() for o in book[side]] for side in ("buy", "sell")}
+            for sym, book in order_books.items() if book.buy or book.sell}
+
+
+def test_records_round_trip():
+    for msg in (NEW, AMEND, CANCEL, dict(AMEND, fields={"price": 99.5}),
+                dict(AMEND, fields={"price": 99.5, "quantity": 3})):
+        assert decode(encode(msg)) == msg
+
+
+def test_records_without_sent_at_still_decode():
+    old = _AMEND.pack(2, 1, 2, math.nan, 4)               # written before the trailer existed
+    assert decode(old) == {"kind": "amend", "order_id": 1, "user_id": 2, "fields": {"quantity": 4}}
+
+
+def test_event_keys():
+    assert event_key(NEW) == event_key(dict(NEW, sent_at=5.0)) == ("new", 1)
+    assert event_key(AMEND) != event_key(dict(AMEND, sent_at=2.0))
+    assert event_key(CANCEL) is None                       # no stamp, no identity
+
+
+def run(msgs: list[dict], batch: int = 100):
+    """Feed messages in batches the way handle_batch does (no ack)."""
+    for i in range(0, len(msgs), batch):
+        consumer.handle_batch([json.dumps(m).encode() for m in msgs[i:i + batch]])
+
+
+def test_snapshot_plus_tail_with_torn_frame(engine, tmp_path):
+    msgs = FLOWS["market_maker"](3050, 3)       # 50 past the last snapshot
+    recover(str(tmp_path), snapshot_every=1000)
+    run(msgs)
+    want, seq = books(), consumer.journal.seq
+    consumer.journal.close()
+
+    segments = sorted(p for p in os.listdir(tmp_path) if p.startswith("journal-"))
+    assert len(segments) == 1 and "snapshot.bin" in os.listdir(tmp_path)
+    tail = tmp_path / segments[0]
+    good = tail.stat().st_size
+    torn = _frame(encode(NEW | {"order_id": 10 ** 9}))
+    with open(tail, "ab") as f:
+        f.write(torn[:_FRAME.size + 5])                   # crash mid-write
+
+    replay.reset("memory")
+    replayed = recover(str(tmp_path), snapshot_every=1000)
+    assert replayed == 50
+    assert consumer.journal.seq == seq
+    assert books() == want
+    assert 10 ** 9 not in order_index
+    assert tail.stat().st_size == good                    # torn tail cut off
+    assert consumer.trade_sink.count == 0                 # replayed fills are already in the DB
+
+
+def test_redelivery_after_snapshot_before_ack(engine, tmp_path):
+    batch = [dict(NEW, order_id=6, user_id=2, order_type="sell"),
+             dict(NEW, order_id=7, user_id=1, order_type="buy"),
+             dict(NEW, order_id=8, user_id=1, order_type="buy", price=99.0),
+             dict(AMEND, order_id=8, user_id=1)]
+    recover(str(tmp_path), snapshot_every=len(batch))
+    run(batch)                                            # snapshot taken, then "crash"
+    want = books()
+    assert [p for p in os.listdir(tmp_path) if p.startswith("journal-")] == [
+        "journal-000000000005.bin"]
+
+    replay.reset("memory")
+    assert recover(str(tmp_path), snapshot_every=len(batch)) == 0
+    run(batch)                                            # the broker hands it back
+    assert books() == want
+    assert consumer.trade_sink.trades == []
+
+
+def test_v1_snapshot_loads(engine, tmp_path):
+    with open(tmp_path / "snapshot.bin", "wb") as f:
+        f.write(_SNAP.pack(_MAGIC1, 5) + _frame(encode(NEW)))
+    assert read_snapshot(str(tmp_path / "snapshot.bin")) == (5, [], [NEW])
+    assert recover(str(tmp_path)) == 0 and consumer.journal.seq == 5
+    assert books()["AAPL"]["sell"][0]["order_id"] == 1
+
+
+def test_read_segment_stops_at_torn_tail(tmp_path):
+    path = tmp_path / "journal-000000000001.bin"
+    with open(path, "wb") as f:
+        f.write(_frame(encode(NEW)) + _frame(encode(AMEND)) + _frame(encode(CANCEL))[:-1])
+    assert list(read_segment(str(path))) == [NEW, AMEND]
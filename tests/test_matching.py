@@ -0,0 +1,166 @@
+# tests/test_matching.py
+# The book against a naive reference matcher: every resting order in one
+# list, the best counter-order found by a full scan – slow, but obviously
+# price-time priority.  Both get the same messages; fills and the final
+# books must come out identical.
+import random
+
+import pytest
+
+from benchmarks.flows import FLOWS
+from matching_engine import consumer
+from matching_engine.order_book import PRICE_SCALE, order_books, order_index, to_ticks
+
+
+class Reference:
+    def __init__(self):
+        self.resting: dict[int, list] = {}         # order_id → [seq, user, sym, side, ticks, qty]
+        self.seen: set[int] = set()
+        self.fills: list[tuple] = []
+        self.seq = 0
+
+    def apply(self, msg: dict):
+        kind = msg.get("kind") or "new"
+        getattr(self, kind)(msg)
+
+    def new(self, msg: dict):
+        if msg["order_id"] in self.seen:
+            return
+        self.seen.add(msg["order_id"])
+        self._enter(msg["order_id"], [0, msg["user_id"], msg["stock_symbol"].upper(),
+                                      msg["order_type"], to_ticks(msg["price"]), msg["quantity"]])
+
+    def amend(self, msg: dict):
+        o = self.resting.get(msg["order_id"])
+        if o is None or o[1] != msg["user_id"]:
+            return
+        ticks = to_ticks(msg["fields"]["price"]) if "price" in msg["fields"] else o[4]
+        qty   = msg["fields"].get("quantity", o[5])
+        if ticks == o[4] and qty <= o[5]:
+            o[5] = qty                                  # keeps its place
+            return
+        del self.resting[msg["order_id"]]
+        o[4], o[5] = ticks, qty
+        self._enter(msg["order_id"], o)
+
+    def cancel(self, msg: dict):
+        o = self.resting.get(msg["order_id"])
+        if o is not None and o[1] == msg["user_id"]:
+            del self.resting[msg["order_id"]]
+
+    def _enter(self, oid: int, o: list):
+        _, user, sym, side, ticks, _ = o
+        buy = side == "buy"
+        while o[5]:
+            opp = [(r[4] if buy else -r[4], r[0], k) for k, r in self.resting.items()
+                   if r[2] == sym and r[3] != side and (r[4] <= ticks if buy else r[4] >= ticks)]
+            if not opp:
+                break
+            best = self.resting[min(opp)[2]]
+            qty  = min(o[5], best[5])
+            self.fills.append((user if buy else best[1], best[1] if buy else user,
+                               sym, best[4] / PRICE_SCALE, qty))
+            o[5] -= qty
+            best[5] -= qty
+            if not best[5]:
+                del self.resting[next(k for k, r in self.resting.items() if r is best)]
+        if o[5]:
+            self.seq += 1
+            o[0] = self.seq
+            self.resting[oid] = o
+
+    def books(self) -> dict:
+        out: dict = {}
+        for oid, (seq, _user, sym, side, ticks, qty) in self.resting.items():
+            out.setdefault(sym, {"buy": [], "sell": []})[side].append(
+                ((-ticks if side == "buy" else ticks, seq), oid, qty))
+        return {sym: {side: [(oid, qty) for _k, oid, qty in sorted(orders)]
+                      for side, orders in sides.items()}
+                for sym, sides in out.items()}
+
+
+def engine_books() -> dict:
+    return {sym: {side: [(o.order_id, o.quantity) for o in book[side]] for side in ("buy", "sell")}
+            for sym, book in order_books.items() if book.buy or book.sell}
+
+
+def random_flow(n: int, seed: int) -> list[dict]:
+    """New / amend / cancel on two symbols, some aimed at unknown ids or the wrong user."""
+    rnd, out, ids = random.Random(seed), [], []
+    for i in range(1, n + 1):
+        r = rnd.random()
+        if r < 0.6 or not ids:
+            oid = len(ids) + 1
+            ids.append((oid, rnd.randint(1, 5)))
+            out.append({"kind": "new", "order_id": oid, "user_id": ids[-1][1],
+                        "stock_symbol": rnd.choice(("AAA", "bbb")),
+                        "order_type": rnd.choice(("buy", "sell")),
+                        "price": round(100 + rnd.randint(-10, 10) * 0.25, 2),
+                        "quantity": rnd.randint(1, 20)})
+            continue
+        oid, user = rnd.choice(ids)
+        if rnd.random() < 0.1:
+            user += 1                                   # not the owner: ignored
+        if r < 0.85:
+            fields = {}
+            if rnd.random() < 0.5:
+                fields["price"] = round(100 + rnd.randint(-10, 10) * 0.25, 2)
+            if rnd.random() < 0.7 or not fields:
+                fields["quantity"] = rnd.randint(1, 25)
+            out.append({"kind": "amend", "order_id": oid, "user_id": user,
+                        "fields": fields, "sent_at": float(i)})
+        else:
+            out.append({"kind": "cancel", "order_id": oid, "user_id": user, "sent_at": float(i)})
+    return out
+
+
+def check(engine, msgs: list[dict]):
+    ref = Reference()
+    for msg in msgs:
+        consumer.dispatch(dict(msg, fields=dict(msg["fields"])) if "fields" in msg else dict(msg))
+        ref.apply(msg)
+    assert engine.trades == ref.fills
+    assert engine_books() == ref.books()
+    assert sorted(order_index) == sorted(ref.resting)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_flow_matches_reference(engine, seed):
+    check(engine, random_flow(3000, seed))
+
+
+@pytest.mark.parametrize("flow", ["uniform", "market_maker", "cancel_storm", "deep_sweep"])
+def test_benchmark_flows_match_reference(engine, flow):
+    check(engine, FLOWS[flow](2000, 7))
+
+
+def test_amend_down_keeps_priority_amend_up_loses_it(engine):
+    for oid, qty in ((1, 10), (2, 10)):
+        consumer.dispatch({"order_id": oid, "user_id": oid, "stock_symbol": "AAA",
+                           "order_type": "buy", "price": 10.0, "quantity": qty})
+    consumer.dispatch({"kind": "amend", "order_id": 1, "user_id": 1, "fields": {"quantity": 5}})
+    assert engine_books()["AAA"]["buy"] == [(1, 5), (2, 10)]
+    consumer.dispatch({"kind": "amend", "order_id": 1, "user_id": 1, "fields": {"quantity": 6}})
+    assert engine_books()["AAA"]["buy"] == [(2, 10), (1, 6)]
+
+
+def test_redelivered_new_order_is_applied_once(engine):
+    sell = {"order_id": 1, "user_id": 1, "stock_symbol": "AAA", "order_type": "sell",
+            "price": 10.0, "quantity": 10}
+    buy  = {"order_id": 2, "user_id": 2, "stock_symbol": "AAA", "order_type": "buy",
+            "price": 10.0, "quantity": 4}
+    for msg in (sell, buy, dict(buy), dict(sell)):
+        consumer.dispatch(msg)
+    assert engine.trades == [(2, 1, "AAA", 10.0, 4)]
+    assert engine_books()["AAA"]["sell"] == [(1, 6)]
+
+
+def test_duplicate_id_never_rests_twice(engine):
+    book = order_books["AAA"]
+    msg  = {"order_id": 7, "user_id": 1, "stock_symbol": "AAA", "order_type": "buy",
+            "price": 10.0, "quantity": 10}
+    consumer.dispatch(msg)
+    consumer.recent.clear()                             # past the dedup window
+    consumer.dispatch(dict(msg, price=11.0))
+    assert book.buy.depth == {to_ticks(10.0): 10}
+    assert [o.order_id for o in book.buy] == [7]
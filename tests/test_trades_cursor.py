@@ -0,0 +1,66 @@
+# tests/test_trades_cursor.py
+# Keyset paging of /trades: walking X-Next-Cursor page by page must visit
+# every trade exactly once, newest first, ties on timestamp included.
+# Runs the real queries against in-memory SQLite.
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from api.trades import _decode_cursor, _encode_cursor, _page
+from db.database import Base
+from models.trade import Trade
+from models.user import User
+
+
+@pytest.fixture
+def db():
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng, tables=[User.__table__, Trade.__table__])
+    rnd, t0 = random.Random(3), datetime(2026, 1, 1)
+    with Session(eng) as s:
+        s.execute(insert(User), [{"id": i, "username": f"u{i}", "email": f"u{i}@x",
+                                  "hashed_password": "-"} for i in (1, 2, 3)])
+        s.execute(insert(Trade), [
+            {"buyer_id": rnd.randint(1, 3), "seller_id": rnd.randint(1, 3),
+             "stock_symbol": rnd.choice(("AAA", "BBB")), "price": 10.0, "quantity": 1,
+             "timestamp": t0 + timedelta(seconds=rnd.randint(0, 40))}    # plenty of ties
+            for _ in range(200)])
+        s.commit()
+        yield s
+
+
+def walk(db: Session, symbol: str | None, limit: int) -> list[int]:
+    """What a client following X-Next-Cursor sees (see _send_page)."""
+    ids, cursor = [], None
+    while True:
+        rows = db.scalars(_page(symbol, cursor, limit)).all()
+        ids += [t.id for t in rows]
+        assert len(ids) <= 200, "pages repeat rows"
+        if len(rows) < limit:
+            return ids
+        cursor = _encode_cursor(rows[-1])
+
+
+@pytest.mark.parametrize("symbol", [None, "aaa"])
+@pytest.mark.parametrize("limit", [1, 7, 50, 200])
+def test_pages_cover_everything_once_newest_first(db, symbol, limit):
+    trades = db.query(Trade).all()
+    want = [t.id for t in sorted(trades, key=lambda t: (t.timestamp, t.id), reverse=True)
+            if symbol is None or t.stock_symbol == symbol.upper()]
+    assert walk(db, symbol, limit) == want
+
+
+def test_cursor_round_trip():
+    t = Trade(id=42, timestamp=datetime(2026, 1, 2, 3, 4, 5, 678))
+    assert _decode_cursor(_encode_cursor(t)) == (t.timestamp, 42)
+
+
+@pytest.mark.parametrize("bad", ["", "not-base64!", "MjAyNg=="])
+def test_bad_cursor_is_400(bad):
+    with pytest.raises(HTTPException) as e:
+        _decode_cursor(bad)
+    assert e.value.status_code == 400
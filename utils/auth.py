@@ -1,13 +1,16 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import NamedTuple
+import threading, time
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 
-from db.database import SessionLocal
+from sqlalchemy import select
+from db.database import AsyncSessionLocal
 from models.user import User
 
 load_dotenv()
@@ -20,6 +23,11 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
+# token → user cache (see get_current_user)
+AUTH_CACHE_SIZE   = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL    = float(os.getenv("AUTH_CACHE_TTL", "60"))            # seconds
+AUTH_TRUST_CLAIMS = os.getenv("AUTH_TRUST_CLAIMS", "false").lower() == "true"
+
 # OAuth2 password bearer (FastAPI built-in)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -32,15 +40,82 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-# Create JWT access token
+# Create JWT access token (login puts "sub" = email and "user_id" in it)
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+class AuthUser(NamedTuple):
+    """Who a token belongs to – all the endpoints need, no DB session attached."""
+    id:       int
+    email:    str
+    username: str | None = None
+
+
+class _TokenCache:
+    """LRU of token → AuthUser; entries live AUTH_CACHE_TTL or until the token expires."""
+
+    def __init__(self, size: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.size = size
+        self.ttl  = ttl
+        self._entries: OrderedDict[str, tuple[AuthUser, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> AuthUser | None:
+        with self._lock:
+            hit = self._entries.get(token)
+            if hit is None:
+                return None
+            if hit[1] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return hit[0]
+
+    def put(self, token: str, user: AuthUser, exp: float | None):
+        expires = time.time() + self.ttl
+        if exp is not None:
+            expires = min(expires, exp)
+        with self._lock:
+            self._entries[token] = (user, expires)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def drop(self, match) -> int:
+        with self._lock:
+            stale = [t for t, (u, _) in self._entries.items() if match(t, u)]
+            for t in stale:
+                del self._entries[t]
+        return len(stale)
+
+
+_token_cache = _TokenCache()
+
+# Invalidation hooks – call after changing / deleting a user or revoking a token
+def invalidate_token(token: str):
+    _token_cache.drop(lambda t, _u: t == token)
+
+def invalidate_user(user_id: int | None = None, email: str | None = None) -> int:
+    return _token_cache.drop(lambda _t, u: u.id == user_id or u.email == email)
+
+def clear_auth_cache():
+    _token_cache.drop(lambda _t, _u: True)
+
 # ✅ Get the current user from JWT in request header
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> AuthUser:
+    """
+    Resolve the bearer token to an AuthUser.  Cached per token, so repeat
+    requests skip both the JWT decode and the DB.  With AUTH_TRUST_CLAIMS
+    a token carrying a "user_id" claim is trusted as is – no DB lookup
+    even on a miss (the signature is still checked).
+    """
+    user = _token_cache.get(token)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
@@ -49,11 +124,16 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
-    db: Session = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
-    db.close()
-
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
+    if AUTH_TRUST_CLAIMS and payload.get("user_id") is not None:
+        user = AuthUser(int(payload["user_id"]), email)
+    else:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(User.id, User.email, User.username).where(User.email == email)
+            )).first()
+        if row is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = AuthUser(*row)
 
+    _token_cache.put(token, user, payload.get("exp"))
     return user